@@ -0,0 +1,110 @@
+"""
+Measures how much memory a window takes, by building window trees and
+adding up the size of every object they own. Objects every window shares
+through its class, like the default colors, aren't counted.
+
+    python -m benchmarks.memory --windows 10000 100000
+"""
+from __future__ import print_function
+import argparse
+import collections
+import gc
+import sys
+import types
+import weakref
+
+import jgui.settings
+jgui.settings.DEBUG = False
+
+from jgui.surface import Window, TextWindow, ZOrderList, Style
+
+#Never owned by a single window
+SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                int, bool, type(None))
+
+
+STYLE = dict(background_color=(0.2, 0.4, 0.6), border_color=(0, 0, 0, 1),
+             border_radius=4, border_width=2)
+
+
+def build_tree(windows, fanout=8, styled=None):
+    """
+    Returns the root of a tree of windows, each with up to fanout children.
+    styled is None for windows with the default style, 'own' to give every
+    window its own colors and border, or 'shared' to give them all one
+    Style with the same options.
+    """
+    root = Window('root', size=[800, 600])
+    parents = collections.deque([root])
+    shared = Style(**STYLE)
+    for i in range(windows - 1):
+        parent = parents[0]
+        kwargs = dict(position=[i % 50, i % 40], size=[40, 30])
+        if styled == 'own':
+            kwargs.update(STYLE)
+        elif styled == 'shared':
+            kwargs['style'] = shared
+        window = Window('window{}'.format(i), **kwargs)
+        parent.add_child(window)
+        parents.append(window)
+        if len(parent.children) >= fanout:
+            parents.popleft()
+    return root
+
+
+def shared_objects():
+    """Returns the ids of everything reachable from the window classes."""
+    seen = set()
+    stack = []
+    for cls in (Window, TextWindow, ZOrderList):
+        for base in cls.__mro__:
+            stack.extend(base.__dict__.values())
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        stack.extend(gc.get_referents(obj))
+    return seen
+
+
+def tree_size(root, exclude):
+    """Returns the total bytes of the objects owned by the tree and the bytes per type."""
+    seen = set(exclude)
+    by_type = collections.Counter()
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        by_type[type(obj).__name__] += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+        #Styles keep weak references to their windows
+        stack.extend(weakref.getweakrefs(obj))
+    return sum(by_type.values()), by_type
+
+
+def run(counts=(10000, 100000), fanout=8):
+    exclude = shared_objects()
+    results = {}
+    for styled in (None, 'own', 'shared'):
+        for count in counts:
+            root = build_tree(count, fanout, styled)
+            total, by_type = tree_size(root, exclude)
+            name = '{} {}'.format(styled or 'default', count)
+            results[name] = total/float(count)
+            largest = ', '.join('{} {:.0f}'.format(type_name, size/float(count))
+                                for type_name, size in by_type.most_common(4))
+            print('{:<16} {:>8.0f} bytes per window   ({})'.format(name, results[name], largest))
+            del root
+            gc.collect()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--windows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--fanout', type=int, default=8)
+    args = parser.parse_args()
+    run(args.windows, args.fanout)
@@ -0,0 +1,52 @@
+"""
+Measures how long it takes to build the outline of a window in
+draw_rounded_rect, with and without the path cache.
+
+    python -m benchmarks.rounded_rect
+"""
+from __future__ import print_function
+import timeit
+from jgui.surface import Surface, Window, WindowSurface
+
+
+def run(number=5000, repeat=5):
+    surface = Surface([800, 600])
+    context = surface.context
+    window = Window('bench', position=[10, 10], size=[300, 200],
+                    border_width=3, border_radius=[20, 10],
+                    clip_children=True, ignore_debug=True, surface=surface)
+    radius = window.border_radius
+
+    def build_path():
+        context.new_path()
+        window.rounded_rect_path(10, 10, 300, 200, radius, 3)
+        window.rounded_rect_path(10, 10, 300, 200, radius, 3, 1.5)
+
+    def draw_rounded_rect():
+        context.save()
+        window.draw_rounded_rect([0, 0], window.size,
+                                 background_color=window.background_color,
+                                 line_color=window.border_color,
+                                 line_width=window.border_width,
+                                 corner_radius=window.border_radius,
+                                 clip=True)
+        context.restore()
+
+    results = {}
+    for cached in (False, True):
+        WindowSurface.cache_paths = cached
+        window.path_cache = None
+        for name, func in (('path', build_path), ('draw_rounded_rect', draw_rounded_rect)):
+            best = min(timeit.repeat(func, number=number, repeat=repeat))
+            results[name, cached] = best/number*1e6
+    WindowSurface.cache_paths = True
+
+    for name in ('path', 'draw_rounded_rect'):
+        before, after = results[name, False], results[name, True]
+        print('{:<20} {:8.2f} us -> {:8.2f} us per window ({:.1f}x)'.format(
+              name, before, after, before/after))
+    return results
+
+
+if __name__ == '__main__':
+    run()
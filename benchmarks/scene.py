@@ -0,0 +1,65 @@
+"""
+Compares queries and changes over a whole scene done one window at a
+time with the same done at once by a SceneStore. Needs numpy.
+
+    python -m benchmarks.scene --windows 1000 10000
+"""
+from __future__ import print_function
+import argparse
+import random
+import timeit
+
+import jgui.settings
+jgui.settings.DEBUG = False
+
+from jgui.surface import Surface, Position, Rectangle
+from benchmarks.suite import build_scene
+
+
+def run(counts=(1000, 10000), points=1000, repeat=3):
+    results = {}
+    for count in counts:
+        surface = Surface([800, 600], scene_store=True)
+        windows = build_scene(surface, count, 4, seed=1)
+        store = surface.scene_store
+        rand = random.Random(1)
+        positions = [Position(rand.uniform(0, 800), rand.uniform(0, 600)) for i in range(points)]
+        top = [window for window in windows if window.parent is surface.root_window]
+        area = Rectangle([200, 150], [400, 300])
+
+        def move_each():
+            for window in top:
+                window.move_by([1, 1])
+
+        def cull_each():
+            return [window for window in windows if window.visible and
+                    window.absolute_rectangle().overlaps(area)]
+
+        def changed(func):
+            #Query right after the scene changed, like the first query of a frame
+            def query():
+                store.changed = True
+                return func()
+            return query
+
+        tests = (('hit-test {} points'.format(points),
+                  lambda: [surface.spatial_index.window_at(p) for p in positions],
+                  lambda: store.hit_test(positions)),
+                 ('cull after a change', cull_each, changed(lambda: store.cull(area))),
+                 ('move {} subtrees'.format(len(top)), move_each,
+                  lambda: store.move_by(top, (1, 1))))
+        for name, one_by_one, at_once in tests:
+            before = min(timeit.repeat(one_by_one, number=1, repeat=repeat))*1000
+            after = min(timeit.repeat(at_once, number=1, repeat=repeat))*1000
+            results[count, name] = (before, after)
+            print('{:>6} windows  {:<24} {:9.2f} ms -> {:9.2f} ms ({:.1f}x)'.format(
+                  count, name, before, after, before/after))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--windows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--points', type=int, default=1000)
+    args = parser.parse_args()
+    run(args.windows, args.points)
@@ -0,0 +1,118 @@
+"""
+Compares the slotted value types in jgui.surface.structures with a copy
+of the dict backed versions they replaced: bytes per instance and the
+time it takes to create, compare and unpack them.
+
+    python -m benchmarks.structures
+"""
+from __future__ import print_function
+import sys
+import timeit
+from jgui.surface.structures import Position, Size, Color
+
+
+#The value types as they were before they had slots
+class LegacyStructureBase(object):
+    @classmethod
+    def _attrs(cls):
+        a = []
+        i = cls()
+        for attr in dir(i):
+            if not attr.startswith('_') and not callable(getattr(i, attr)):
+                a.append(attr)
+        return a
+
+    def __eq__(self, other):
+        eq = True
+        for attr in self._attrs():
+            val = getattr(self, attr)
+            if hasattr(other, attr):
+                eq &= getattr(other, attr) == val
+            else:
+                return False
+        return eq
+
+    def __ne__(self, other):
+        return not(self == other)
+
+    def __len__(self):
+        return len(self._attrs())
+
+    @classmethod
+    def from_value(cls, value):
+        if isinstance(value, cls):
+            return value
+        else:
+            try:
+                return cls(*value)
+            except TypeError:
+                return cls()
+
+
+class LegacyPosition(LegacyStructureBase):
+    def __init__(self, x=0, y=0):
+        self.x = x
+        self.y = y
+
+    def __iter__(self):
+        return iter([self.x, self.y])
+
+
+class LegacySize(LegacyStructureBase):
+    def __init__(self, width=0, height=0):
+        self.width = width
+        self.height = height
+
+    def __iter__(self):
+        return iter([self.width, self.height])
+
+
+class LegacyColor(LegacyStructureBase):
+    def __init__(self, r=0, g=0, b=0, a=1):
+        self.r = float(r)
+        self.g = float(g)
+        self.b = float(b)
+        self.a = float(a)
+
+    def __iter__(self):
+        return iter([self.r, self.g, self.b, self.a])
+
+
+def instance_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def run(number=100000, repeat=5):
+    results = {}
+    for name, position, size, color in (('legacy', LegacyPosition, LegacySize, LegacyColor),
+                                        ('slots', Position, Size, Color)):
+        a, b = position(10, 20), position(10, 20)
+        tests = {
+            'from_value': lambda: position.from_value((10, 20)),
+            'rewrap': lambda: position.from_value(a),
+            'eq': lambda: a == b,
+            'ne': lambda: a != position(0, 0),
+            'unpack': lambda: tuple(a),
+            'len': lambda: len(a),
+            'color': lambda: color.from_value((1, 0.5, 0.25, 1)),
+        }
+        for test, func in tests.items():
+            best = min(timeit.repeat(func, number=number, repeat=repeat))
+            results[test, name] = best/number*1e9
+        results['bytes', name] = sum(instance_size(obj) for obj in
+                                     (position(1, 2), size(1, 2), color(1, 1, 1, 1)))
+
+    print('{:<12} {:>12} {:>12}'.format('', 'legacy', 'slots'))
+    print('{:<12} {:>12} {:>12}   Position + Size + Color'.format(
+          'bytes', results['bytes', 'legacy'], results['bytes', 'slots']))
+    for test in ('from_value', 'rewrap', 'eq', 'ne', 'unpack', 'len', 'color'):
+        before, after = results[test, 'legacy'], results[test, 'slots']
+        print('{:<12} {:>9.0f} ns {:>9.0f} ns   ({:.1f}x)'.format(test, before, after, before/after))
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,180 @@
+"""
+Headless benchmarks for drawing, hit-testing and event injection on
+synthetic scenes. Everything is drawn into a plain cairo.ImageSurface,
+so no display is needed. Results are printed as JSON so that runs can
+be compared with each other.
+
+    python -m benchmarks.suite --windows 10 100 500 --depth 3 --output bench.json
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import random
+import time
+import timeit
+
+import jgui.settings
+jgui.settings.DEBUG = False
+
+from jgui.surface import Surface, Window, TextWindow, Gradient, RadialGradient, Color, Position
+from jgui.settings import IMG_DIR
+
+
+def build_scene(surface, windows=100, depth=3, text=0.25, gradient=0.25, image=0.25,
+                resizable=False, seed=0):
+    """
+    Adds a tree of windows to the surface. text, gradient and image are the
+    fractions of windows that get text, a gradient or a background image;
+    the rest are plain colored windows.
+    """
+    rand = random.Random(seed)
+    image_path = os.path.join(IMG_DIR, 'wrench.png')
+    levels = [[surface.root_window]]
+    created = []
+    for i in range(windows):
+        level = rand.randint(0, min(depth, len(levels)) - 1)
+        parent = rand.choice(levels[level])
+        width = max(20, int(parent.size.width*rand.uniform(0.2, 0.6)))
+        height = max(20, int(parent.size.height*rand.uniform(0.2, 0.6)))
+        kwargs = dict(position=[rand.randint(0, max(0, int(parent.size.width) - width)),
+                                rand.randint(0, max(0, int(parent.size.height) - height))],
+                      size=[width, height],
+                      border_width=2, border_radius=rand.randint(0, 10),
+                      border_color=(0, 0, 0), background_color=(rand.random(), rand.random(), rand.random()),
+                      draggable=True, resizable=resizable, clip_children=rand.random() < 0.5)
+
+        kind = rand.random()
+        if kind < text:
+            window = TextWindow('text{}'.format(i), 'Window number {}'.format(i), **kwargs)
+        else:
+            kind -= text
+            if kind < gradient:
+                if rand.random() < 0.5:
+                    kwargs['gradient'] = Gradient(stops=[(0, Color(1, 1, 1)), (1, Color(0.3, 0.3, 0.3))])
+                else:
+                    kwargs['gradient'] = RadialGradient(start_position=[0.5, 0.5], end_position=[0.5, 0.5],
+                                                        inner_radius=0, outer_radius=width,
+                                                        stops=[(0, Color(1, 1, 1)), (1, Color(0, 0, 0.5))])
+            elif kind - gradient < image:
+                kwargs['background_image'] = image_path
+                kwargs['background_image_stretch_horizontal'] = True
+                kwargs['background_image_stretch_vertical'] = True
+            window = Window('window{}'.format(i), **kwargs)
+
+        parent.add_child(window)
+        created.append(window)
+        if level + 1 < depth:
+            if len(levels) <= level + 1:
+                levels.append([])
+            levels[level + 1].append(window)
+    return created
+
+
+def measure(func, number, repeat):
+    """Returns the time per call of func in milliseconds."""
+    times = [t/number*1000.0 for t in timeit.repeat(func, number=number, repeat=repeat)]
+    times.sort()
+    return {'min': times[0],
+            'median': times[len(times)//2],
+            'max': times[-1],
+            'number': number,
+            'repeat': repeat}
+
+
+def run_scene(size=(1280, 720), windows=100, depth=3, text=0.25, gradient=0.25, image=0.25,
+              resizable=False, seed=0, number=20, repeat=5):
+    params = dict(size=list(size), windows=windows, depth=depth, text=text, gradient=gradient,
+                  image=image, resizable=resizable, seed=seed)
+    rand = random.Random(seed)
+    points = [(rand.uniform(0, size[0]), rand.uniform(0, size[1])) for i in range(number)]
+    results = {}
+
+    def construct():
+        surface = Surface(size)
+        build_scene(surface, windows, depth, text, gradient, image, resizable, seed)
+    results['construct'] = measure(construct, 1, repeat)
+
+    surface = Surface(size)
+    build_scene(surface, windows, depth, text, gradient, image, resizable, seed)
+
+    def draw():
+        surface.invalidate()
+        surface.draw()
+    results['draw'] = measure(draw, number, repeat)
+
+    #Moving the mouse a few pixels repaints very little with damage tracking
+    surface.damage_tracking = True
+    point = iter(points*(repeat + 1))
+    def draw_after_move():
+        surface.inject_mouse_position(next(point))
+        surface.draw()
+    results['draw_after_move'] = measure(draw_after_move, number, repeat)
+    surface.damage_tracking = False
+
+    point = iter(points*(repeat + 1))
+    def mouse_inside():
+        surface.mouse_pos = Position.from_value(next(point))
+        surface.mouse_inside()
+    results['mouse_inside'] = measure(mouse_inside, number, repeat)
+
+    point = iter(points*(repeat + 1))
+    def inject_mouse_position():
+        surface.inject_mouse_position(next(point))
+    results['inject_mouse_position'] = measure(inject_mouse_position, number, repeat)
+
+    #Only the windows under or leaving the mouse get the moves
+    surface.route_mouse_moves = True
+    point = iter(points*(repeat + 1))
+    results['route_mouse_position'] = measure(inject_mouse_position, number, repeat)
+    surface.route_mouse_moves = False
+
+    point = iter(points*(repeat + 1))
+    def inject_mouse_click():
+        surface.inject_mouse_position(next(point))
+        surface.inject_mouse_down('mouse-left')
+        surface.inject_mouse_up('mouse-left')
+    results['inject_mouse_click'] = measure(inject_mouse_click, number, repeat)
+
+    return {'params': params, 'results': results}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--windows', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--depth', type=int, nargs='+', default=[3])
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--text', type=float, default=0.25)
+    parser.add_argument('--gradient', type=float, default=0.25)
+    parser.add_argument('--image', type=float, default=0.25)
+    parser.add_argument('--resizable', choices=['on', 'off', 'both'], default='both')
+    parser.add_argument('--number', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    args = parser.parse_args(args)
+
+    resizable = {'on': [True], 'off': [False], 'both': [False, True]}[args.resizable]
+    scenes = []
+    for windows in args.windows:
+        for depth in args.depth:
+            for handles in resizable:
+                scenes.append(run_scene(args.size, windows, depth, args.text, args.gradient,
+                                        args.image, handles, args.seed, args.number, args.repeat))
+
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'scenes': scenes}
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Times raising, lowering and removing the children of a window in a
+ZOrderList of different sizes. Moving an item in the middle is O(1),
+while moving or removing the item at either end finds the new end in
+O(n). Every run first checks the list against a plain list doing the
+same changes.
+
+    python -m benchmarks.zorder --items 10 100 1000 10000
+"""
+from __future__ import print_function
+import argparse
+import itertools
+import random
+import timeit
+
+from jgui.surface import ZOrderList
+
+
+def check(changes=2000, seed=1):
+    """Makes random changes to a ZOrderList and a list and compares them."""
+    rand = random.Random(seed)
+    items = ZOrderList()
+    expected = []
+    reorders = []
+    items.accept('reorder', lambda children, item: reorders.append(item))
+    for i in range(changes):
+        change = rand.randrange(4)
+        if change == 0 or not expected:
+            item = rand.randrange(30)
+            if item in expected:
+                expected.remove(item)
+            expected.append(item)
+            items.append(item)
+        elif change == 1:
+            item = rand.choice(expected)
+            expected.remove(item)
+            items.remove(item)
+        elif change == 2:
+            item = rand.choice(expected)
+            moved = expected[-1] != item
+            expected.remove(item)
+            expected.append(item)
+            del reorders[:]
+            items.raise_to_top(item)
+            assert reorders == ([item] if moved else []), 'raising the top item reordered'
+        else:
+            item = rand.choice(expected)
+            moved = expected[0] != item
+            expected.remove(item)
+            expected.insert(0, item)
+            del reorders[:]
+            items.lower_to_bottom(item)
+            assert reorders == ([item] if moved else []), 'lowering the bottom item reordered'
+        assert items.items() == expected, 'the order differs after {} changes'.format(i + 1)
+        for item in expected:
+            assert items.is_top(item) == (item == expected[-1])
+
+
+def run(counts=(10, 100, 1000, 10000), number=1000, repeat=3):
+    check()
+    results = {}
+    for count in counts:
+        rand = random.Random(1)
+        #Raising a random item rarely moves the one at the bottom
+        picks = itertools.cycle([rand.randrange(count) for i in range(number)])
+        #Raising the items in order always moves the one at the bottom
+        bottoms = itertools.cycle(range(count))
+        top = count - 1
+
+        def raise_middle(items):
+            items.raise_to_top(next(picks))
+
+        def raise_bottom(items):
+            items.raise_to_top(next(bottoms))
+
+        def remove_top(items):
+            items.remove(top)
+            items.append(top)
+
+        for test, func in (('raise middle', raise_middle), ('raise bottom', raise_bottom),
+                           ('remove top', remove_top)):
+            items = ZOrderList(range(count))
+            best = min(timeit.repeat(lambda: func(items), number=number, repeat=repeat))
+            results[test, count] = best/number*1e6
+
+    print('{:<14}'.format('items') + ''.join('{:>12}'.format(count) for count in counts))
+    for test in ('raise middle', 'raise bottom', 'remove top'):
+        print('{:<14}'.format(test) +
+              ''.join('{:>9.1f} us'.format(results[test, count]) for count in counts))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--number', type=int, default=1000)
+    args = parser.parse_args()
+    run(args.items, args.number)
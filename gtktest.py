@@ -17,44 +17,67 @@ class JGUIWidget(gtk.DrawingArea):
         self.connect("configure_event", self.resize_win)
         self.connect("scroll_event", self.mouse_scroll)
         self.add_events(gdk.BUTTON_PRESS_MASK | gdk.BUTTON_RELEASE_MASK | gdk.POINTER_MOTION_MASK)
-        gobject.timeout_add(int((1.0/60.0)*1000), self.tick)
+        #Only schedule frames when something changed, at most 60 times a second
+        self.redraw_pending = False
+        self.surf.accept('redraw-needed', self.request_redraw)
+        #Input queued from other threads asks for a frame through the main loop
+        self.surf.wakeup = lambda: gobject.idle_add(self.wake)
         self.width, self.height = width, height
         self.set_size_request(width, height)
 
     def mouse_up(self, widget, event):
-        self.surf.inject_mouse_up(self.buttons[event.button])
+        self.surf.queue_mouse_up(self.buttons[event.button])
 
     def mouse_down(self, widget, event):
         if event.type == gtk.gdk.BUTTON_PRESS:
-            self.surf.inject_mouse_down(self.buttons[event.button])
+            self.surf.queue_mouse_down(self.buttons[event.button])
         elif event.type == gtk.gdk._2BUTTON_PRESS:
-            self.surf.inject_mouse_double(self.buttons[event.button])
+            self.surf.queue_mouse_double(self.buttons[event.button])
 
     def mouse_scroll(self, widget, event):
         if event.direction == gtk.gdk.SCROLL_UP:
             direction = 1
         else:
             direction = -1
-        self.surf.inject_mouse_wheel(direction)
+        self.surf.queue_mouse_wheel(direction)
 
     def resize_win(self, widget, event):
         self.surf.notify_window_resize(event.width, event.height)
 
+    def request_redraw(self, surface):
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            gobject.timeout_add(int((1.0/60.0)*1000), self.tick)
+
+    def wake(self):
+        self.request_redraw(self.surf)
+        return False
+
     def tick(self):
+        self.redraw_pending = False
         self.alloc = self.get_allocation()
         rect = gdk.Rectangle(self.alloc.x, self.alloc.y, self.alloc.width, self.alloc.height)
         self.window.invalidate_rect(rect, True)
-        return True
+        return False
 
     def expose(self, widget, event):
         self.surf.draw()
+        stats = self.surf.frame_stats
+        if stats is not None:
+            stats.start('upload')
         context = widget.window.cairo_create()
         #Just set the source image to be the cairo image surface of the Surface object
         context.set_source_surface(self.surf.csurface, 0, 0)
         context.paint()
+        if stats is not None:
+            stats.stop()
 
     def mousemoved(self, widget, event):
-        self.surf.inject_mouse_position([event.x, event.y])
+        #Motion events are queued and merged, so only the last one before a
+        #frame does any work. Mouse positions are surface coordinates, compare
+        #them with Window.absolute_position rather than the parent relative
+        #Window.position.
+        self.surf.queue_mouse_position([event.x, event.y])
 
 
 class GTKJGUI(object):
@@ -68,6 +91,7 @@ class GTKJGUI(object):
         self.drawingarea.show()
         self.window.show()
         gtk.main()
+        self.drawingarea.surf.close()
 
     def realize(self, widget):
         pixmap = gtk.gdk.Pixmap(None, 1, 1, 1)
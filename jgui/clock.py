@@ -0,0 +1,55 @@
+"""
+The clock frames, traces and input timestamps are measured with. It's
+monotonic, so adjusting the system time doesn't make spans jump.
+"""
+import ctypes
+import ctypes.util
+import sys
+import time
+
+__all__ = ['clock']
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _clock_gettime():
+    """Returns a function reading CLOCK_MONOTONIC in seconds, or None."""
+    monotonic_id = 6 if sys.platform == 'darwin' else 1
+    #Older glibc keeps clock_gettime in librt
+    for name in ('c', 'rt'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+        if clock_gettime(monotonic_id, ctypes.byref(_timespec())) != 0:
+            continue
+
+        def monotonic():
+            #A new timespec every call, input can be queued from any thread
+            spec = _timespec()
+            clock_gettime(monotonic_id, ctypes.byref(spec))
+            return spec.tv_sec + spec.tv_nsec*1e-9
+        return monotonic
+    return None
+
+
+def _find_clock():
+    #Python 3 has one built in
+    clock = getattr(time, 'perf_counter', None)
+    if clock is None:
+        clock = _clock_gettime()
+    if clock is None and sys.platform == 'win32':
+        #QueryPerformanceCounter, which doesn't follow the system time
+        clock = time.clock
+    if clock is None:
+        #Nothing monotonic on this platform
+        clock = time.time
+    return clock
+
+clock = _find_clock()
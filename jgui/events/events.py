@@ -1,33 +1,363 @@
+import collections
+import functools
+import gc
+import types
+import weakref
+
 
 class Event(object):
-    def __init__(self, name='event', data=None):
+    """
+    An event travelling along a path of windows, from the root down to the
+    target in the capture phase and back up in the bubble phase.
+
+    name: name of the event, eg. 'mouse-left'
+    data: arguments the listeners are called with
+    """
+    def __init__(self, name='event', data=None, target=None):
         self.name = name
         self.data = data
+        self.target = target
+        #The window whose listeners are being called and the phase it's in:
+        #'capture', 'target' or 'bubble'
+        self.current_target = None
+        self.phase = None
+        self.stopped = False
+
+    def stop_propagation(self):
+        """Stops the event after the listeners of the current window."""
+        self.stopped = True
+
+
+class Subscription(object):
+    """
+    A callback accepted by EventSource.subscribe. cancel() removes it
+    without looking through the other listeners.
+
+    A weak subscription only keeps a weak reference to its callback, or
+    to the object of a bound method, and cancels itself once that object
+    is collected. Only callables that something else keeps alive can be
+    held weakly: a function, a bound method or a callable object.
+    """
+    __slots__ = ('source', 'key', 'callback', 'weak')
+
+    def __init__(self, source, key, callback, weak=False):
+        self.source = source
+        self.key = key
+        self.weak = weak
+        if weak:
+            if isinstance(callback, types.MethodType):
+                if callback.im_self is None:
+                    raise TypeError('An unbound method is made on every lookup and '
+                                    'can\'t be held weakly, use a bound method')
+                #Bound methods are made on every lookup and would die right
+                #away, so refer to the object and call the function with it
+                self.callback = (weakref.ref(callback.im_self, self._collected), callback.im_func)
+            else:
+                try:
+                    self.callback = (weakref.ref(callback, self._collected), None)
+                except TypeError:
+                    raise TypeError('{!r} can\'t be held weakly'.format(callback))
+        else:
+            self.callback = callback
+
+    def __call__(self, *args, **kwargs):
+        if self.source is None:
+            #Cancelled, but still in the callbacks of a dispatch under way
+            return
+        if not self.weak:
+            return self.callback(*args, **kwargs)
+        reference, function = self.callback
+        target = reference()
+        if target is not None:
+            if function is None:
+                return target(*args, **kwargs)
+            return function(target, *args, **kwargs)
+
+    @property
+    def active(self):
+        return self.source is not None
+
+    def target(self):
+        """Returns the callback, None once it was collected."""
+        if not self.weak:
+            return self.callback
+        reference, function = self.callback
+        target = reference()
+        if target is None or function is None:
+            return target
+        return function.__get__(target, type(target))
+
+    def cancel(self):
+        """Stops calling the callback, cancelling again does nothing."""
+        source = self.source
+        if source is not None:
+            self.source = None
+            source._discard(self)
+
+    def _collected(self, reference):
+        self.cancel()
+
 
 class EventSource(object):
     types = [] # list of event names
+    tracer = None # set by Tracer.install to record every dispatch
+
+    #The Event being propagated, listeners can stop it through this
+    current_event = None
+
+    #Number of capture and bubble listeners per key, phases without any are
+    #skipped without looking at the windows on the path
+    phase_listeners = collections.Counter()
+    #id of a source with capture or bubble listeners -> (weak reference
+    #to it, its own counts), to take them back when it's collected
+    _phase_sources = {}
+
+    phases = ('capture', 'target', 'bubble')
+
+    #Sources without listeners share this instead of having their own table
+    no_listeners = {}
+    #(callbacks, priorities, cancelled) of events without listeners
+    no_callbacks = ((), (), 0)
+
+    __slots__ = ('events',)
 
     def __init__(self):
         super(EventSource, self).__init__()
-        self.events = {}
-        for type in self.types:
-            self.events[type] = []
+        #listener key -> (callbacks, priorities, cancelled), the callbacks
+        #sorted from the highest priority down and ready to be called, and
+        #how many of them are cancelled Subscriptions not dropped yet. A
+        #table is only made when the first callback is accepted.
+        self.events = self.no_listeners
+
+    @classmethod
+    def _type_set(cls):
+        #Looked up on every accept, so keep a set of the names per class
+        types = cls.__dict__.get('_type_set_cache')
+        if types is None or types[0] is not cls.types:
+            types = (cls.types, frozenset(cls.types))
+            cls._type_set_cache = types
+        return types[1]
 
-    def accept(self, event, callback):
-        if event in self.events:
-            if callback not in self.events[event]:
-                self.events[event].append(callback)
+    @staticmethod
+    def listener_key(event, phase):
+        """Returns the key the listeners of the event in the phase are stored under."""
+        if phase == 'target':
+            return event
+        return '{}@{}'.format(event, phase)
+
+    @staticmethod
+    def listener_counts():
+        """
+        Returns how many listeners are alive per listener key, over every
+        source that wasn't collected. Counts that keep growing while
+        windows come and go point at listeners keeping them alive. Looks
+        through every object the garbage collector tracks, so it's meant
+        for debugging rather than for every frame.
+        """
+        counts = collections.Counter()
+        for source in gc.get_objects():
+            if isinstance(source, EventSource):
+                for key, (callbacks, priorities, cancelled) in source.events.items():
+                    counts[key] += len(callbacks) - cancelled
+        return counts
+
+    def accept(self, event, callback, priority=0, phase='target'):
+        """
+        Calls callback whenever the event is dispatched. Callbacks with a
+        higher priority are called first. Use subscribe for a handle to
+        cancel the callback with, or to only hold it weakly.
+
+        phase: 'target' to only hear the event when it's dispatched on
+               this source, 'capture' or 'bubble' to also hear it on its
+               way down to, or up from, a descendant window
+        """
+        if event in self._type_set():
+            if phase not in self.phases:
+                raise ValueError('Unknown phase {}'.format(phase))
+            key = self.listener_key(event, phase)
+            if self._find(key, callback) is None:
+                self._insert(key, callback, priority)
+
+    def subscribe(self, event, callback, priority=0, phase='target', weak=False):
+        """
+        Like accept, but returns a Subscription that cancels the callback,
+        or None if the event isn't one of types. Subscribing a callback
+        that is already accepted returns its Subscription, or None if it
+        was accepted without one.
+
+        weak: only keep a weak reference to the callback, or to the object
+              of a bound method, so that listening doesn't keep it alive
+        """
+        if event in self._type_set():
+            if phase not in self.phases:
+                raise ValueError('Unknown phase {}'.format(phase))
+            key = self.listener_key(event, phase)
+            found = self._find(key, callback)
+            if found is not None:
+                return found if isinstance(found, Subscription) else None
+            subscription = Subscription(self, key, callback, weak)
+            self._insert(key, subscription, priority)
+            return subscription
+
+    def callbacks(self, key):
+        """Returns the callbacks listening under key in the order they're called."""
+        return self.events.get(key, self.no_callbacks)[0]
 
     def dispatch(self, event, *args, **kwargs):
-        for callback in self.events[event]:
-            callback(*args, **kwargs)
+        tracer = self.tracer
+        callbacks = self.events.get(event, self.no_callbacks)[0]
+        if tracer is None:
+            for callback in callbacks:
+                callback(*args, **kwargs)
+        else:
+            start = tracer.now()
+            for callback in callbacks:
+                callback(*args, **kwargs)
+            tracer.complete(event, 'dispatch', start,
+                            {'window': getattr(self, 'name', self.__class__.__name__),
+                             'listeners': len(callbacks)})
+
+    def reject(self, event, callback, phase='target'):
+        """Stops calling callback, cancelling its Subscription does the same faster."""
+        key = self.listener_key(event, phase)
+        found = self._find(key, callback)
+        if isinstance(found, Subscription):
+            found.cancel()
+        elif found is not None:
+            callbacks, priorities, cancelled = self.events[key]
+            index = callbacks.index(found)
+            self._store(key, callbacks[:index] + callbacks[index + 1:],
+                        priorities[:index] + priorities[index + 1:], cancelled)
+            self._count(key, -1)
+
+    def _find(self, key, callback):
+        #Returns the accepted callback or active Subscription equal to callback
+        for listener in self.events.get(key, self.no_callbacks)[0]:
+            if isinstance(listener, Subscription):
+                if listener.source is not None and listener.target() == callback:
+                    return listener
+            elif listener == callback:
+                return listener
+        return None
+
+    def _insert(self, key, callback, priority):
+        events = self.events
+        if events is self.no_listeners:
+            events = self.events = {}
+        callbacks, priorities, cancelled = events.get(key, self.no_callbacks)
+        #After the callbacks with the same or a higher priority
+        index = len(priorities)
+        while index and priorities[index - 1] < priority:
+            index -= 1
+        events[key] = (callbacks[:index] + (callback,) + callbacks[index:],
+                       priorities[:index] + (priority,) + priorities[index:], cancelled)
+        self._count(key, 1)
 
-    def reject(self, event, callback):
-        if event in self.events:
-            if callback in self.events[event]:
-                self.events[event].remove(callback)
+    def _store(self, key, callbacks, priorities, cancelled):
+        if callbacks:
+            self.events[key] = (callbacks, priorities, cancelled)
+        else:
+            del self.events[key]
+
+    def _discard(self, subscription):
+        #Called by Subscription.cancel. The subscription stays in the
+        #callbacks, where calling it does nothing, until cancelled ones
+        #are half of them and are all dropped in one go.
+        key = subscription.key
+        callbacks, priorities, cancelled = self.events[key]
+        cancelled += 1
+        if cancelled*2 > len(callbacks):
+            kept = [(callback, priority) for callback, priority in zip(callbacks, priorities)
+                    if not isinstance(callback, Subscription) or callback.source is not None]
+            self._store(key, tuple(callback for callback, priority in kept),
+                        tuple(priority for callback, priority in kept), 0)
+        else:
+            self.events[key] = (callbacks, priorities, cancelled)
+        self._count(key, -1)
+
+    def _count(self, key, change):
+        #Keeps phase_listeners up to date for the capture and bubble keys
+        if key in self._type_set():
+            return
+        self.phase_listeners[key] += change
+        sources = EventSource._phase_sources
+        entry = sources.get(id(self))
+        if entry is None:
+            try:
+                reference = weakref.ref(self, functools.partial(
+                    EventSource._phase_source_collected, id(self)))
+            except TypeError:
+                #Can't tell when it's collected, its counts stay
+                return
+            entry = sources[id(self)] = (reference, collections.Counter())
+        counts = entry[1]
+        counts[key] += change
+        if not counts[key]:
+            del counts[key]
+            if not counts:
+                del sources[id(self)]
+
+    @staticmethod
+    def _phase_source_collected(ident, reference):
+        reference, counts = EventSource._phase_sources.pop(ident)
+        EventSource.phase_listeners.subtract(counts)
+
+
+def propagate(path, event, *args):
+    """
+    Dispatches an event to the last window of path. Windows before it,
+    from the root down, hear it first if they capture the event and again
+    on its way back up if they listen to it bubbling. The target hears it
+    with its capture, target and bubble listeners, in that order.
+
+    Listeners are called with args and can stop the event from going
+    further through EventSource.current_event. Returns the Event.
+    """
+    target = path[-1]
+    capture_key = EventSource.listener_key(event, 'capture')
+    bubble_key = EventSource.listener_key(event, 'bubble')
+    capture = EventSource.phase_listeners[capture_key] > 0
+    bubble = EventSource.phase_listeners[bubble_key] > 0
+    event_object = Event(event, args, target)
+    previous = EventSource.current_event
+    EventSource.current_event = event_object
+    try:
+        if not capture and not bubble:
+            #Nothing listens along the path, only the target needs to be told
+            event_object.phase = 'target'
+            event_object.current_target = target
+            target.dispatch(event, *args)
+            return event_object
+
+        steps = []
+        if capture:
+            steps.extend(('capture', window, capture_key) for window in path[:-1])
+            steps.append(('target', target, capture_key))
+        steps.append(('target', target, event))
+        if bubble:
+            steps.append(('target', target, bubble_key))
+            steps.extend(('bubble', window, bubble_key) for window in reversed(path[:-1]))
+
+        current = None
+        for phase, window, key in steps:
+            if window is not current:
+                if event_object.stopped:
+                    break
+                current = window
+            event_object.phase = phase
+            event_object.current_target = window
+            if key == event:
+                window.dispatch(event, *args)
+            else:
+                for callback in window.callbacks(key):
+                    callback(*args)
+    finally:
+        EventSource.current_event = previous
+    return event_object
 
 class WindowEventSource(EventSource):
+    __slots__ = ()
+
     mouse_events = ['mouse-enter', 'mouse-leave', 'drag', 'mouse-move', 'hover']
     mouse_wheel_events = ['scroll']
     mouse_button_down_events = ['mouse-right', 'mouse-left', 'mouse-middle']
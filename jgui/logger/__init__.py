@@ -1 +1,2 @@
 from jgui.logger.logger import *
+from jgui.logger.trace import *
@@ -0,0 +1,76 @@
+import collections
+import functools
+import json
+import os
+import threading
+from jgui.events import EventSource
+from jgui.clock import clock
+
+
+class Tracer(object):
+    """
+    Records spans of drawing, rendering, event dispatch and input handling
+    into a ring buffer and exports them as Chrome/Perfetto trace events,
+    to be opened in chrome://tracing or ui.perfetto.dev.
+
+    Only the newest max_events spans are kept, so a tracer can be left on
+    in a long running session.
+    """
+    def __init__(self, max_events=100000):
+        self.events = collections.deque(maxlen=max_events)
+        self.pid = os.getpid()
+
+    def install(self):
+        """Starts tracing every surface, window and event source."""
+        EventSource.tracer = self
+        return self
+
+    @staticmethod
+    def uninstall():
+        EventSource.tracer = None
+
+    now = staticmethod(clock)
+
+    def complete(self, name, category, start, args=None):
+        """Records a span that started at start (from Tracer.now) and ends now."""
+        self.events.append((name, category, start, clock(), threading.current_thread().ident, args))
+
+    def trace_events(self):
+        events = []
+        for name, category, start, end, thread, args in list(self.events):
+            event = {'name': name, 'cat': category, 'ph': 'X',
+                     'ts': start*1e6, 'dur': (end - start)*1e6,
+                     'pid': self.pid, 'tid': thread}
+            if args:
+                event['args'] = args
+            events.append(event)
+        return events
+
+    def dump(self, path):
+        """Writes the recorded spans to path as trace event JSON."""
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+    def clear(self):
+        self.events.clear()
+
+
+def traced(category, name=None):
+    """Records a span for every call of the method while a tracer is installed."""
+    def decorator(func):
+        span_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            tracer = self.tracer
+            if tracer is None:
+                return func(self, *args, **kwargs)
+            start = clock()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                span_args = {'window': getattr(self, 'name', self.__class__.__name__)}
+                if args:
+                    span_args['args'] = [repr(arg) for arg in args]
+                tracer.complete(span_name, category, start, span_args)
+        return wrapper
+    return decorator
@@ -1,2 +1,8 @@
 from jgui.surface.surface import *
 from jgui.surface.structures import *
+from jgui.surface.cache import *
+from jgui.surface.tiles import *
+from jgui.surface.stats import *
+from jgui.surface.spatial import *
+from jgui.surface.zorder import *
+from jgui.surface.style import *
@@ -0,0 +1,132 @@
+import collections
+import os
+
+
+class LRUCache(object):
+    """
+    A least recently used cache with a budget in bytes. Every entry is
+    stored along with its size and the oldest entries are evicted once
+    the total size goes over max_bytes.
+    """
+    def __init__(self, max_bytes=64*1024*1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        #Reinserting moves the entry to the most recently used end
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        self.discard(key)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (value, nbytes)
+        self.bytes += nbytes
+        self._shrink()
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._shrink()
+
+    def _shrink(self):
+        while self.bytes > self.max_bytes and self._entries:
+            key, (value, nbytes) = self._entries.popitem(last=False)
+            self.bytes -= nbytes
+            self.evictions += 1
+            self.evicted(key, value)
+
+    def evicted(self, key, value):
+        """Called after an entry was evicted to stay within the budget."""
+        pass
+
+    def stats(self):
+        return {'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class ImageCache(LRUCache):
+    """
+    Decoded images shared by everything that loads the same file. Images
+    are keyed on their path and modification time, so a file that changes
+    on disk gets decoded again.
+
+    loader: callable that decodes the image at a path
+    sizeof: callable that returns the size of a decoded image in bytes
+    """
+    def __init__(self, loader, sizeof, max_bytes=64*1024*1024):
+        super(ImageCache, self).__init__(max_bytes)
+        self.loader = loader
+        self.sizeof = sizeof
+        self._keys = {}
+
+    def load(self, path):
+        path = os.path.abspath(path)
+        try:
+            key = (path, os.path.getmtime(path))
+        except OSError:
+            #Let the loader report the missing file
+            return self.loader(path)
+
+        image = self.get(key)
+        if image is None:
+            image = self.loader(path)
+            old_key = self._keys.get(path)
+            if old_key is not None:
+                self.discard(old_key)
+            self.put(key, image, self.sizeof(image))
+            #Images over the budget aren't kept
+            if key in self:
+                self._keys[path] = key
+        return image
+
+    def evicted(self, key, value):
+        self._forget(key)
+
+    def discard(self, key):
+        super(ImageCache, self).discard(key)
+        self._forget(key)
+
+    def _forget(self, key):
+        #The path goes along with its image, or every path ever loaded
+        #would stay in _keys
+        if self._keys.get(key[0]) == key:
+            del self._keys[key[0]]
+
+    def preload(self, paths):
+        """Decodes the given images ahead of time, eg. while starting up."""
+        for path in paths:
+            self.load(path)
+
+    def clear(self):
+        super(ImageCache, self).clear()
+        self._keys.clear()
@@ -0,0 +1,378 @@
+try:
+    import numpy
+except ImportError:
+    #SceneStore is optional and only works with numpy
+    numpy = None
+
+from .structures import Position, Size, Rectangle, frozen
+
+
+class RowRectangle(Rectangle):
+    """
+    The rectangle of a window kept in a SceneStore. Reading the position
+    or size returns frozen values built from the row, changing them in
+    place raises instead of being lost, so assign new ones like
+    Window.position and Window.size do.
+    """
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def position(self):
+        return frozen(Position(float(self.store.x[self.row]), float(self.store.y[self.row])))
+
+    @position.setter
+    def position(self, position):
+        position = Position.from_value(position)
+        self.store.x[self.row] = position.x
+        self.store.y[self.row] = position.y
+        self.store.changed = True
+
+    @property
+    def size(self):
+        return frozen(Size(float(self.store.width[self.row]), float(self.store.height[self.row])))
+
+    @size.setter
+    def size(self, size):
+        size = Size.from_value(size)
+        self.store.width[self.row] = size.width
+        self.store.height[self.row] = size.height
+        self.store.changed = True
+
+
+class SceneStore(object):
+    """
+    Keeps the geometry, visibility, clipping, parents and drawing order of
+    the windows of a surface in numpy arrays, one row per window, so that
+    questions about the whole scene can be answered without a python loop
+    over the window tree. Windows added to the store read and write their
+    position and size from their row, everything else about them works
+    like before.
+
+    The arrays are indexed by row, rows of removed windows are reused.
+    Positions are relative to the parent, like Window.position.
+
+    capacity: number of rows to allocate up front, the arrays grow as needed
+    """
+    def __init__(self, capacity=1024):
+        if numpy is None:
+            raise ImportError('SceneStore needs numpy')
+        capacity = max(1, capacity)
+        self.x = numpy.zeros(capacity)
+        self.y = numpy.zeros(capacity)
+        self.width = numpy.zeros(capacity)
+        self.height = numpy.zeros(capacity)
+        #How far the resize handles reach outside of the window
+        self.handle_width = numpy.zeros(capacity)
+        self.handle_height = numpy.zeros(capacity)
+        #How far drawing the window reaches outside of it
+        self.margin = numpy.zeros(capacity)
+        self.visible = numpy.zeros(capacity, dtype=bool)
+        self.clip = numpy.zeros(capacity, dtype=bool)
+        self.used = numpy.zeros(capacity, dtype=bool)
+        self.parent = numpy.full(capacity, -1, dtype=numpy.int64)
+        self.depth = numpy.zeros(capacity, dtype=numpy.int64)
+        #Larger numbers are drawn later, on top
+        self.order = numpy.zeros(capacity, dtype=numpy.int64)
+
+        self.windows = [None]*capacity
+        self.rows = {}
+        self.free = []
+        self.top = 0
+
+        #Set when positions, sizes or flags change, the hit bounds are
+        #computed again on the next query
+        self.changed = True
+        #Set when windows are added, removed or reordered
+        self.structure_changed = True
+        self._levels = None
+        self._bounds = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, window):
+        return window in self.rows
+
+    def watch(self, surface):
+        """Follows the windows that are added to, removed from or raised in the surface."""
+        surface.accept('children-add', self.child_added)
+        surface.accept('children-remove', self.child_removed)
+        surface.accept('children-reorder', self.children_reordered)
+
+    def child_added(self, children, window):
+        if children.owner in self:
+            self.add_tree(window)
+
+    def child_removed(self, children, window):
+        self.remove_tree(window)
+
+    def children_reordered(self, children, window):
+        self.reorder()
+
+    def row(self, window):
+        return self.rows[window]
+
+    def add_tree(self, window):
+        """Gives the window and all of its descendants a row."""
+        stack = [window]
+        while stack:
+            item = stack.pop()
+            if item not in self.rows:
+                row = self._allocate()
+                rectangle = item.rectangle
+                self.windows[row] = item
+                self.rows[item] = row
+                self.used[row] = True
+                self.x[row], self.y[row] = rectangle.position.x, rectangle.position.y
+                self.width[row], self.height[row] = rectangle.size.width, rectangle.size.height
+                item.rectangle = RowRectangle(self, row)
+            self._link(item)
+            if item.children:
+                stack.extend(item.children)
+        self.changed = self.structure_changed = True
+
+    def remove_tree(self, window):
+        """Frees the rows of the window and its descendants, they keep their geometry."""
+        stack = [window]
+        while stack:
+            item = stack.pop()
+            row = self.rows.pop(item, None)
+            if row is not None:
+                item.rectangle = Rectangle(Position(*item.rectangle.position), Size(*item.rectangle.size))
+                self.windows[row] = None
+                self.used[row] = False
+                self.parent[row] = -1
+                self.free.append(row)
+            if item.children:
+                stack.extend(item.children)
+        self.changed = self.structure_changed = True
+
+    def update(self, window):
+        """Copies the flags of the window that hit-testing and culling need to its row."""
+        row = self.rows.get(window)
+        if row is not None:
+            self.visible[row] = window.visible
+            self.clip[row] = window.clip_children
+            buffer = window.edge_handle_buffer if window.resizable else Size(0, 0)
+            self.handle_width[row] = buffer.width
+            self.handle_height[row] = buffer.height
+            self.margin[row] = window.paint_margin
+            self.changed = True
+
+    def reorder(self):
+        """Marks the drawing order as stale after children were raised or lowered."""
+        self.structure_changed = True
+
+    def _allocate(self):
+        if self.free:
+            return self.free.pop()
+        if self.top == len(self.used):
+            self._grow(2*len(self.used))
+        self.top += 1
+        return self.top - 1
+
+    def _grow(self, capacity):
+        for name in ('x', 'y', 'width', 'height', 'handle_width', 'handle_height', 'margin',
+                     'visible', 'clip', 'used', 'parent', 'depth', 'order'):
+            old = getattr(self, name)
+            new = numpy.zeros(capacity, dtype=old.dtype)
+            if name == 'parent':
+                new.fill(-1)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self.windows.extend([None]*(capacity - len(self.windows)))
+
+    def _link(self, window):
+        row = self.rows[window]
+        parent = self.rows.get(window.parent, -1)
+        self.parent[row] = parent
+        self.depth[row] = self.depth[parent] + 1 if parent >= 0 else 0
+        self.update(window)
+
+    def levels(self):
+        """Returns arrays with the rows of every depth, from the roots down."""
+        if self.structure_changed:
+            self._update_structure()
+        return self._levels
+
+    def _update_structure(self):
+        rows = numpy.flatnonzero(self.used[:self.top])
+        depth = self.depth[rows]
+        rows = rows[numpy.argsort(depth, kind='mergesort')]
+        splits = numpy.flatnonzero(numpy.diff(numpy.sort(depth))) + 1
+        self._levels = numpy.split(rows, splits) if len(rows) else []
+
+        #Drawing order: parents before their children, children from the
+        #bottom to the top
+        self.order[:] = 0
+        rank = 0
+        stack = [self.windows[row] for row in reversed(self._levels[0])] if self._levels else []
+        while stack:
+            window = stack.pop()
+            rank += 1
+            self.order[self.rows[window]] = rank
+            if window.children:
+                stack.extend(child for child in reversed(window.children.items())
+                             if child in self.rows)
+        self.structure_changed = False
+        self.changed = True
+
+    def absolute_positions(self):
+        """Returns the x and y arrays of every row on the surface."""
+        levels = self.levels()
+        ax = numpy.zeros(len(self.x))
+        ay = numpy.zeros(len(self.y))
+        for depth, rows in enumerate(levels):
+            ax[rows] = self.x[rows]
+            ay[rows] = self.y[rows]
+            if depth:
+                parents = self.parent[rows]
+                ax[rows] += ax[parents]
+                ay[rows] += ay[parents]
+        return ax, ay
+
+    def hit_bounds(self):
+        """
+        Returns x0, y0, x1 and y1 arrays with the area of every row that
+        can be hit by the mouse: the rectangle, with the resize handles,
+        clipped by the clipping ancestors. Rows that can't be hit are empty.
+        """
+        if self._bounds is not None and not self.changed and not self.structure_changed:
+            return self._bounds
+        levels = self.levels()
+        ax, ay = self.absolute_positions()
+        x1, y1 = ax + self.width, ay + self.height
+        #Handles only reach out of windows that don't clip
+        handles = ~self.clip
+        x0 = ax - self.handle_width*handles
+        y0 = ay - self.handle_height*handles
+        hx1 = x1 + self.handle_width*handles
+        hy1 = y1 + self.handle_height*handles
+
+        #The area that the children of each row are clipped to
+        cx0 = numpy.full(len(ax), -numpy.inf)
+        cy0 = numpy.full(len(ax), -numpy.inf)
+        cx1 = numpy.full(len(ax), numpy.inf)
+        cy1 = numpy.full(len(ax), numpy.inf)
+        visible = self.visible & self.used
+        for depth, rows in enumerate(levels):
+            if depth:
+                parents = self.parent[rows]
+                visible[rows] &= visible[parents]
+                cx0[rows], cy0[rows] = cx0[parents], cy0[parents]
+                cx1[rows], cy1[rows] = cx1[parents], cy1[parents]
+            bx0 = numpy.maximum(x0[rows], cx0[rows])
+            by0 = numpy.maximum(y0[rows], cy0[rows])
+            bx1 = numpy.minimum(hx1[rows], cx1[rows])
+            by1 = numpy.minimum(hy1[rows], cy1[rows])
+            x0[rows], y0[rows], hx1[rows], hy1[rows] = bx0, by0, bx1, by1
+            clip = rows[self.clip[rows]]
+            cx0[clip] = numpy.maximum(cx0[clip], ax[clip])
+            cy0[clip] = numpy.maximum(cy0[clip], ay[clip])
+            cx1[clip] = numpy.minimum(cx1[clip], x1[clip])
+            cy1[clip] = numpy.minimum(cy1[clip], y1[clip])
+
+        hittable = visible & (x0 < hx1) & (y0 < hy1)
+        self._bounds = (x0, y0, hx1, hy1, hittable)
+        self.changed = False
+        return self._bounds
+
+    def window_at(self, position):
+        """Returns the topmost visible window at the position, or None."""
+        position = Position.from_value(position)
+        x0, y0, x1, y1, hittable = self.hit_bounds()
+        hits = numpy.flatnonzero(hittable & (x0 <= position.x) & (position.x < x1) &
+                                 (y0 <= position.y) & (position.y < y1))
+        if not len(hits):
+            return None
+        return self.windows[hits[numpy.argmax(self.order[hits])]]
+
+    def hit_test(self, positions, chunk=64):
+        """Returns the topmost window, or None, at each of many positions."""
+        points = numpy.asarray([tuple(Position.from_value(p)) for p in positions],
+                               dtype=numpy.float64).reshape(-1, 2)
+        x0, y0, x1, y1, hittable = self.hit_bounds()
+        rows = numpy.flatnonzero(hittable)
+        if not len(rows):
+            return [None]*len(points)
+        x0, y0, x1, y1 = x0[rows, None], y0[rows, None], x1[rows, None], y1[rows, None]
+        order = self.order[rows, None]
+        found = []
+        #One row per window and one column per position, a few positions
+        #at a time to keep the arrays small
+        for start in xrange(0, len(points), chunk):
+            px = points[start:start + chunk, 0]
+            py = points[start:start + chunk, 1]
+            inside = (x0 <= px) & (px < x1) & (y0 <= py) & (py < y1)
+            best = numpy.where(inside, order, 0).argmax(axis=0)
+            for column, index in enumerate(best):
+                found.append(self.windows[rows[index]] if inside[index, column] else None)
+        return found
+
+    def cull(self, rectangle):
+        """Returns the visible windows that can be hit inside the rectangle, in drawing order."""
+        rectangle = Rectangle.from_value(rectangle)
+        x, y = rectangle.position.x, rectangle.position.y
+        right, bottom = x + rectangle.size.width, y + rectangle.size.height
+        x0, y0, x1, y1, hittable = self.hit_bounds()
+        rows = numpy.flatnonzero(hittable & (x0 < right) & (x < x1) & (y0 < bottom) & (y < y1))
+        rows = rows[numpy.argsort(self.order[rows])]
+        return [self.windows[row] for row in rows]
+
+    def painted_in(self, rectangles):
+        """
+        Returns the set of windows whose rectangle, grown by their paint
+        margin, overlaps any of the rectangles, like Window.paint_rectangle
+        without the background image. Ancestors clipping them aren't taken
+        into account.
+        """
+        ax, ay = self.absolute_positions()
+        x0, y0 = ax - self.margin, ay - self.margin
+        x1 = ax + self.width + self.margin
+        y1 = ay + self.height + self.margin
+        painted = numpy.zeros(len(ax), dtype=bool)
+        for rectangle in rectangles:
+            x, y = rectangle.position.x, rectangle.position.y
+            painted |= ((x0 < x + rectangle.size.width) & (x < x1) &
+                        (y0 < y + rectangle.size.height) & (y < y1))
+        return set(self.windows[row] for row in numpy.flatnonzero(painted & self.used))
+
+    def move_by(self, windows, offsets):
+        """
+        Moves many windows at once, along with their children. offsets is
+        one (x, y) offset for all of them or one per window.
+        """
+        rows = numpy.fromiter((self.rows[window] for window in windows), dtype=numpy.int64)
+        offsets = numpy.asarray(offsets, dtype=numpy.float64).reshape(-1, 2)
+        self.set_positions(windows, numpy.column_stack([self.x[rows], self.y[rows]]) + offsets)
+
+    def set_positions(self, windows, positions):
+        """
+        Places many windows at once, eg. after a layout pass. Windows get
+        the same notifications as when their position is set one by one.
+        """
+        windows = list(windows)
+        rows = numpy.fromiter((self.rows[window] for window in windows), dtype=numpy.int64)
+        positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 2)
+        moved = (self.x[rows] != positions[:, 0]) | (self.y[rows] != positions[:, 1])
+        windows = [window for window, move in zip(windows, moved) if move]
+        if not windows:
+            return
+        for window in windows:
+            window.damage_tree()
+        rows, positions = rows[moved], positions[moved]
+        self.x[rows] = positions[:, 0]
+        self.y[rows] = positions[:, 1]
+        self.changed = True
+        for window in windows:
+            window.invalidate_positions()
+            window.damage_tree()
+            window.dispatch('move', window, window.position)
+            if window.parent is not None:
+                window.parent.invalidate_layers()
+            if window.surface is not None:
+                window.surface.spatial_index.update_tree(window)
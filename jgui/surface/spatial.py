@@ -0,0 +1,193 @@
+import math
+
+
+class SpatialIndex(object):
+    """
+    A uniform grid over the windows of a surface, used to find the window
+    under the mouse without walking the whole window tree.
+
+    Every window is stored in the cells covered by its rectangle clipped
+    by its clipping ancestors. Windows covering more than max_cells cells,
+    like the root window, are kept aside and checked on every lookup.
+    Changes only mark windows as stale, they are put back into the grid
+    on the next lookup.
+
+    cell_size: width and height of a cell in pixels
+    max_cells: most cells a window gets stored in
+    """
+    def __init__(self, cell_size=64, max_cells=64):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.cells = {}
+        self.large = set()
+        #window -> (clipped bounds or None, cells or None when large)
+        self.entries = {}
+        self.pending = set()
+        #Windows whose whole subtree moved, expanded on the next lookup
+        self.pending_trees = set()
+        #window -> paint order key, cleared whenever children are reordered
+        self.order = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, window):
+        return window in self.entries
+
+    def watch(self, surface):
+        """Follows the windows that are added to, removed from or raised in the surface."""
+        surface.accept('children-add', self.child_added)
+        surface.accept('children-remove', self.child_removed)
+        surface.accept('children-reorder', self.children_reordered)
+
+    def child_added(self, children, window):
+        if children.owner in self:
+            self.add_tree(window)
+
+    def child_removed(self, children, window):
+        self.remove_tree(window)
+
+    def children_reordered(self, children, window):
+        self.reorder()
+
+    def add_tree(self, window):
+        """Indexes the window and all of its descendants."""
+        stack = [window]
+        while stack:
+            item = stack.pop()
+            if item not in self.entries:
+                self.entries[item] = (None, ())
+            self.pending.add(item)
+            if item.children:
+                stack.extend(item.children)
+        self.order.clear()
+
+    def remove_tree(self, window):
+        stack = [window]
+        while stack:
+            item = stack.pop()
+            if item in self.entries:
+                self._unlink(item)
+                del self.entries[item]
+                self.pending.discard(item)
+                self.pending_trees.discard(item)
+            if item.children:
+                stack.extend(item.children)
+        self.order.clear()
+
+    def update(self, window):
+        """Marks the window as moved or resized."""
+        if window in self.entries:
+            self.pending.add(window)
+
+    def update_tree(self, window):
+        """Marks the window and its descendants, eg. when it moved or starts clipping."""
+        if window in self.entries:
+            self.pending_trees.add(window)
+
+    def reorder(self):
+        """Forgets the paint order after children were added, removed or raised."""
+        self.order.clear()
+
+    def paint_order(self, window):
+        """Returns a key that sorts windows in the order they are drawn."""
+        key = self.order.get(window)
+        if key is None:
+            parent = window.parent
+            if parent is None:
+                key = ()
+            else:
+                key = self.paint_order(parent) + (parent.children.z_index(window),)
+            self.order[window] = key
+        return key
+
+    def window_at(self, position):
+        """Returns the topmost visible window at the position, or None."""
+        if self.pending or self.pending_trees:
+            self._flush()
+        x, y = position.x, position.y
+        cell_size = float(self.cell_size)
+        cell = (int(math.floor(x/cell_size)), int(math.floor(y/cell_size)))
+
+        found = None
+        found_key = None
+        for candidates in (self.cells.get(cell, ()), self.large):
+            for window in candidates:
+                x0, y0, x1, y1 = self.entries[window][0]
+                if x0 <= x < x1 and y0 <= y < y1:
+                    key = self.paint_order(window)
+                    if found is None or key > found_key:
+                        found, found_key = window, key
+        return found
+
+    def _unlink(self, window):
+        bounds, cells = self.entries[window]
+        if cells is None:
+            self.large.discard(window)
+        else:
+            for cell in cells:
+                bucket = self.cells[cell]
+                bucket.discard(window)
+                if not bucket:
+                    del self.cells[cell]
+
+    @staticmethod
+    def _clipped_bounds(window):
+        """Returns the (x0, y0, x1, y1) area where the window can be hit, or None."""
+        if not window.visible:
+            return None
+        position, size = window.absolute_position, window.rectangle.size
+        x0, y0 = position.x, position.y
+        x1, y1 = x0 + size.width, y0 + size.height
+        if window.resizable and not window.clip_children:
+            #Resize handles reach past the edges
+            buffer = window.edge_handle_buffer
+            x0 -= buffer.width
+            y0 -= buffer.height
+            x1 += buffer.width
+            y1 += buffer.height
+
+        parent = window.parent
+        while parent is not None:
+            if not parent.visible:
+                return None
+            if parent.clip_children:
+                position, size = parent.absolute_position, parent.rectangle.size
+                x0 = max(x0, position.x)
+                y0 = max(y0, position.y)
+                x1 = min(x1, position.x + size.width)
+                y1 = min(y1, position.y + size.height)
+            parent = parent.parent
+
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return (x0, y0, x1, y1)
+
+    def _flush(self):
+        for window in self.pending_trees:
+            stack = [window]
+            while stack:
+                item = stack.pop()
+                self.pending.add(item)
+                if item.children:
+                    stack.extend(item.children)
+        self.pending_trees.clear()
+
+        cell_size = float(self.cell_size)
+        for window in self.pending:
+            self._unlink(window)
+            bounds = self._clipped_bounds(window)
+            cells = ()
+            if bounds is not None:
+                x0, y0, x1, y1 = bounds
+                columns = range(int(math.floor(x0/cell_size)), int(math.ceil(x1/cell_size)))
+                rows = range(int(math.floor(y0/cell_size)), int(math.ceil(y1/cell_size)))
+                if len(columns)*len(rows) > self.max_cells:
+                    cells = None
+                    self.large.add(window)
+                else:
+                    cells = [(column, row) for column in columns for row in rows]
+                    for cell in cells:
+                        self.cells.setdefault(cell, set()).add(window)
+            self.entries[window] = (bounds, cells)
+        self.pending.clear()
@@ -0,0 +1,132 @@
+import collections
+import contextlib
+import functools
+import weakref
+from ..clock import clock
+
+
+class FrameStats(object):
+    """
+    Collects how long every frame takes, split into phases, and how long
+    each window takes to render. A frame runs from the start of one
+    Surface.draw to the start of the next, so it includes the input that
+    was handled and the upload the host did in between.
+
+    Phases are timed exclusively: when a phase starts inside another one,
+    the outer phase stops counting until the inner one is done.
+
+    samples: number of frames kept for the rolling percentiles
+    """
+    phases = ('input', 'hit-test', 'render', 'traversal', 'upload')
+
+    def __init__(self, samples=300):
+        self.samples = samples
+        self.frames = collections.deque(maxlen=samples)
+        self.intervals = collections.deque(maxlen=samples)
+        self.phase_times = dict((phase, collections.deque(maxlen=samples)) for phase in self.phases)
+        self.window_times = weakref.WeakKeyDictionary()
+        self.frame_count = 0
+        self.current = dict.fromkeys(self.phases, 0.0)
+        self.frame_start = None
+        self._running = []
+
+    def begin_frame(self):
+        """Closes the previous frame and starts a new one."""
+        now = clock()
+        if self.frame_start is not None:
+            self.intervals.append(now - self.frame_start)
+            total = 0.0
+            for phase in self.phases:
+                self.phase_times[phase].append(self.current[phase])
+                total += self.current[phase]
+                self.current[phase] = 0.0
+            self.frames.append(total)
+            self.frame_count += 1
+        self.frame_start = now
+
+    def start(self, phase):
+        now = clock()
+        if self._running:
+            outer = self._running[-1]
+            self.current[outer[0]] += now - outer[1]
+        self._running.append([phase, now])
+
+    def stop(self):
+        """Stops the innermost phase and returns how long it ran."""
+        now = clock()
+        phase, started = self._running.pop()
+        elapsed = now - started
+        self.current[phase] += elapsed
+        if self._running:
+            self._running[-1][1] = now
+        return elapsed
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        """Times a block of code, eg. the host uploading the surface."""
+        self.start(phase)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def add_window(self, window, seconds):
+        totals = self.window_times.get(window)
+        if totals is None:
+            self.window_times[window] = [seconds, 1]
+        else:
+            totals[0] += seconds
+            totals[1] += 1
+
+    def slowest_windows(self, count=10):
+        """Returns (window, total seconds, renders) for the windows that took the longest to render."""
+        windows = [(window, totals[0], totals[1]) for window, totals in self.window_times.items()]
+        windows.sort(key=lambda item: item[1], reverse=True)
+        return windows[:count]
+
+    @staticmethod
+    def _percentiles(values):
+        values = sorted(values)
+        if not values:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+        last = len(values) - 1
+        return {'p50': values[int(round(last*0.50))],
+                'p95': values[int(round(last*0.95))],
+                'p99': values[int(round(last*0.99))]}
+
+    def percentiles(self, phase=None):
+        """Rolling p50/p95/p99 in seconds of whole frames, or of one phase."""
+        if phase is None:
+            return self._percentiles(self.frames)
+        return self._percentiles(self.phase_times[phase])
+
+    def fps(self):
+        if not self.intervals:
+            return 0.0
+        return len(self.intervals)/sum(self.intervals)
+
+    def summary(self):
+        return {'frames': self.frame_count,
+                'fps': self.fps(),
+                'frame': self.percentiles(),
+                'phases': dict((phase, self.percentiles(phase)) for phase in self.phases)}
+
+    def reset(self):
+        self.__init__(self.samples)
+
+
+def timed(phase):
+    """Times a Surface method under the given phase when the surface has frame stats."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            stats = self.frame_stats
+            if stats is None:
+                return func(self, *args, **kwargs)
+            stats.start(phase)
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                stats.stop()
+        return wrapper
+    return decorator
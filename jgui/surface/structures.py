@@ -1,14 +1,30 @@
 import colorsys
 
+try:
+    import numpy
+except ImportError:
+    #Only RectangleArray needs numpy
+    numpy = None
+
 class StructureBase(object):
+    #Value types are allocated a lot, so the ones that can have no __dict__.
+    #_fields lists their values in order for the fast __eq__ and __iter__.
+    __slots__ = ()
+    _fields = ()
+
     @classmethod
     def _attrs(cls):
-        a = []
-        i = cls()
-        for attr in dir(i):
-            if not attr.startswith('_') and not callable(getattr(i, attr)):
-                a.append(attr)
-        return a
+        #Looked up once per class, the attributes can't change afterwards
+        attrs = cls.__dict__.get('_attrs_cache')
+        if attrs is None:
+            a = []
+            i = cls()
+            for attr in dir(i):
+                if not attr.startswith('_') and not callable(getattr(i, attr)):
+                    a.append(attr)
+            attrs = tuple(a)
+            cls._attrs_cache = attrs
+        return attrs
 
     def _dict(self):
         d = {}
@@ -34,6 +50,12 @@ class StructureBase(object):
         return u'{} [{}]'.format(self.__class__.__name__, self._dict_string())
 
     def __eq__(self, other):
+        fields = self._fields
+        if fields and isinstance(other, StructureBase) and other._fields is fields:
+            for attr in fields:
+                if getattr(self, attr) != getattr(other, attr):
+                    return False
+            return True
         eq = True
         for attr in self._attrs():
             val = getattr(self, attr)
@@ -44,7 +66,7 @@ class StructureBase(object):
         return eq
 
     def __getitem__(self, index):
-        return list(self)[index]
+        return tuple(self)[index]
 
     def __len__(self):
         return len(self._attrs())
@@ -63,7 +85,7 @@ class StructureBase(object):
 
     @classmethod
     def from_value(cls, value):
-        if isinstance(value, cls):
+        if value.__class__ is cls or isinstance(value, cls):
             return value
         else:
             try:
@@ -71,11 +93,52 @@ class StructureBase(object):
             except TypeError:
                 return cls()
 
+def _frozen_setattr(self, name, value=None):
+    raise AttributeError("{} is shared and can't be changed, assign a new "
+                         "value instead".format(self.__class__.__name__))
+
+_frozen_classes = {}
+
+def frozen(value):
+    """
+    Returns an immutable copy of a value type, for defaults that are
+    shared by many windows.
+    """
+    cls = value.__class__
+    if cls.__dict__.get('_frozen'):
+        return value
+    frozen_cls = _frozen_classes.get(cls)
+    if frozen_cls is None:
+        frozen_cls = type('Frozen' + cls.__name__, (cls,),
+                          {'__slots__': (),
+                           '__setattr__': _frozen_setattr,
+                           '__delattr__': _frozen_setattr,
+                           '_frozen': True,
+                           '_attrs_cache': cls._attrs()})
+        _frozen_classes[cls] = frozen_cls
+    copy = frozen_cls.__new__(frozen_cls)
+    for attr in cls._fields:
+        object.__setattr__(copy, attr, getattr(value, attr))
+    if hasattr(value, '__dict__'):
+        for attr, item in value.__dict__.items():
+            if isinstance(item, list):
+                item = tuple(item)
+            copy.__dict__[attr] = item
+    return copy
+
+
 class Position(StructureBase):
+    __slots__ = _fields = ('x', 'y')
+
     def __init__(self, x=0, y=0):
         self.x = x
         self.y = y
 
+    def __eq__(self, other):
+        if other.__class__ is Position:
+            return self.x == other.x and self.y == other.y
+        return StructureBase.__eq__(self, other)
+
     def __add__(self, other):
         other = Position.from_value(other)
         return Position(self.x+other.x, self.y+other.y)
@@ -90,14 +153,21 @@ class Position(StructureBase):
         raise Exception("Cannot multiply position by {}.".format(value.__class__.__name__))
 
     def __iter__(self):
-        return iter([self.x, self.y])
+        return iter((self.x, self.y))
 
 
 class Size(StructureBase):
+    __slots__ = _fields = ('width', 'height')
+
     def __init__(self, width=0, height=0):
         self.width = width
         self.height = height
 
+    def __eq__(self, other):
+        if other.__class__ is Size:
+            return self.width == other.width and self.height == other.height
+        return StructureBase.__eq__(self, other)
+
     def __add__(self, other):
         other = Size.from_value(other)
         return Size(self.width+other.width, self.height+other.height)
@@ -124,10 +194,12 @@ class Size(StructureBase):
         return self.width*self.height
 
     def __iter__(self):
-        return iter([self.width, self.height])
+        return iter((self.width, self.height))
 
 
 class FourValueStructure(StructureBase):
+    __slots__ = ()
+
     @classmethod
     def _parse_value(cls, value):
         f = lambda *args: args
@@ -147,13 +219,15 @@ class FourValueStructure(StructureBase):
 
     @classmethod
     def from_value(cls, value):
-        if isinstance(value, cls):
+        if value.__class__ is cls or isinstance(value, cls):
             return value
         else:
             return cls(*cls._parse_value(value))
 
 
 class BorderRadius(FourValueStructure):
+    __slots__ = _fields = ('topleft', 'topright', 'bottomright', 'bottomleft')
+
     def __init__(self, *args, **kwargs):
         values = self._parse_value(args)
         self.topleft = kwargs.get('topleft', values[0])
@@ -162,10 +236,12 @@ class BorderRadius(FourValueStructure):
         self.bottomleft = kwargs.get('bottomleft', values[3])
 
     def __iter__(self):
-        return iter([self.topleft, self.topright, self.bottomright, self.bottomleft])
+        return iter((self.topleft, self.topright, self.bottomright, self.bottomleft))
 
 
 class Padding(FourValueStructure):
+    __slots__ = _fields = ('top', 'right', 'bottom', 'left')
+
     def __init__(self, *args, **kwargs):
         values = self._parse_value(args)
         self.top = kwargs.get('top', values[0])
@@ -174,10 +250,12 @@ class Padding(FourValueStructure):
         self.left = kwargs.get('left', values[3])
 
     def __iter__(self):
-        return iter([self.top, self.right, self.bottom, self.left])
+        return iter((self.top, self.right, self.bottom, self.left))
 
 
 class Color(StructureBase):
+    __slots__ = _fields = ('r', 'g', 'b', 'a')
+
     def __init__(self, r=0, g=0, b=0, a=1):
         self.r = float(r)
         self.g = float(g)
@@ -216,7 +294,7 @@ class Color(StructureBase):
         return self
 
     def __iter__(self):
-        return iter([self.r, self.g, self.b, self.a])
+        return iter((self.r, self.g, self.b, self.a))
 
     @classmethod
     def hex_to_rgba(cls, hex_val):
@@ -244,7 +322,7 @@ class Color(StructureBase):
 
     @classmethod
     def from_value(cls, value):
-        if isinstance(value, cls):
+        if value.__class__ is cls or isinstance(value, cls):
             return value
         try:
             return cls(*value)
@@ -270,6 +348,17 @@ class Gradient(StructureBase):
         self.start_position = Position.from_value(start_position)
         self.end_position = Position.from_value(end_position)
 
+    def key(self):
+        """
+        Returns the values the gradient is drawn from, to tell when
+        something built from it is stale. Nested values can be changed in
+        place, so they're read every time.
+        """
+        start, end = self.start_position, self.end_position
+        return (self._type, start.x, start.y, end.x, end.y,
+                tuple((stop.offset, stop.color.r, stop.color.g, stop.color.b, stop.color.a)
+                      for stop in self.stops))
+
     def get_stops(self, stops):
         gstops = []
         for g_stop in stops:
@@ -289,6 +378,9 @@ class RadialGradient(Gradient):
 
 
 class Rectangle(StructureBase):
+    __slots__ = ('_position', '_size')
+    _fields = ('position', 'size')
+
     def __init__(self, position=None, size=None):
         """ A rectangle object with coordinates and size.
         position: can take the first two values of an array or a Position object
@@ -342,6 +434,31 @@ class Rectangle(StructureBase):
             return Rectangle()
         return Rectangle([newx, newy], [new_width, new_height])
 
+    def overlaps(self, other):
+        """Checks if the two rectangles share any area"""
+        pos, size = self.position, self.size
+        opos, osize = other.position, other.size
+        return pos.x < opos.x + osize.width and opos.x < pos.x + size.width and\
+               pos.y < opos.y + osize.height and opos.y < pos.y + size.height
+
+    def overlaps_any(self, rectangles):
+        for rec in rectangles:
+            if self.overlaps(rec):
+                return True
+        return False
+
+    @classmethod
+    def bounds(cls, rectangles):
+        """Returns the smallest rectangle that contains all of the given rectangles"""
+        rectangles = [cls.from_value(r) for r in rectangles]
+        if not rectangles:
+            return cls()
+        x = min(r.position.x for r in rectangles)
+        y = min(r.position.y for r in rectangles)
+        right = max(r.position.x + r.size.width for r in rectangles)
+        bottom = max(r.position.y + r.size.height for r in rectangles)
+        return cls([x, y], [right - x, bottom - y])
+
     def intersects_with(self, position):
         """Checks if the position is within the bounds of the rectangle including the edges"""
         pos = Position.from_value(position)
@@ -352,3 +469,130 @@ class Rectangle(StructureBase):
                       return True
         return False
 
+
+
+class RectangleArray(object):
+    """
+    Many rectangles stored as one contiguous numpy array, for geometry
+    queries over thousands of windows without a python loop. Follows the
+    same rules as Rectangle: edges on the right and bottom are outside,
+    and empty intersections become zero sized rectangles at (0, 0).
+
+    rectangles: Rectangles or anything Rectangle.from_value takes
+    """
+    def __init__(self, rectangles=()):
+        if numpy is None:
+            raise ImportError('RectangleArray needs numpy')
+        rectangles = [Rectangle.from_value(r) for r in rectangles]
+        self.data = numpy.array([[r.position.x, r.position.y, r.size.width, r.size.height]
+                                 for r in rectangles], dtype=numpy.float64).reshape(-1, 4)
+
+    @classmethod
+    def from_arrays(cls, x, y, width, height):
+        array = cls()
+        array.data = numpy.column_stack([x, y, width, height]).astype(numpy.float64)
+        return array
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long)):
+            x, y, width, height = self.data[index]
+            return Rectangle([x, y], [width, height])
+        array = RectangleArray()
+        array.data = self.data[index].reshape(-1, 4)
+        return array
+
+    def __iter__(self):
+        for i in xrange(len(self.data)):
+            yield self[i]
+
+    def __repr__(self):
+        return u'RectangleArray [{} rectangles]'.format(len(self.data))
+
+    @property
+    def x(self):
+        return self.data[:, 0]
+
+    @property
+    def y(self):
+        return self.data[:, 1]
+
+    @property
+    def width(self):
+        return self.data[:, 2]
+
+    @property
+    def height(self):
+        return self.data[:, 3]
+
+    @property
+    def right(self):
+        return self.data[:, 0] + self.data[:, 2]
+
+    @property
+    def bottom(self):
+        return self.data[:, 1] + self.data[:, 3]
+
+    @staticmethod
+    def _columns(other):
+        """Returns x, y, right and bottom of a Rectangle or a RectangleArray"""
+        if isinstance(other, RectangleArray):
+            return other.x, other.y, other.right, other.bottom
+        other = Rectangle.from_value(other)
+        return (other.position.x, other.position.y,
+                other.position.x + other.size.width, other.position.y + other.size.height)
+
+    def contains_point(self, position):
+        """Returns which rectangles contain the position, like Rectangle.intersects_with"""
+        pos = Position.from_value(position)
+        return (self.x <= pos.x) & (pos.x < self.right) & (self.y <= pos.y) & (pos.y < self.bottom)
+
+    def contains_points(self, points):
+        """Returns an (N rectangles, M points) table of which rectangles contain which points"""
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        px, py = points[:, 0], points[:, 1]
+        return ((self.x[:, None] <= px) & (px < self.right[:, None]) &
+                (self.y[:, None] <= py) & (py < self.bottom[:, None]))
+
+    def overlaps(self, other):
+        """
+        Returns which rectangles share area with other. other is a single
+        rectangle, or a RectangleArray of the same length to compare row by row.
+        """
+        x, y, right, bottom = self._columns(other)
+        return (self.x < right) & (x < self.right) & (self.y < bottom) & (y < self.bottom)
+
+    def overlaps_pairwise(self, other):
+        """Returns an (N, M) table of which rectangles of self overlap which of other"""
+        other = other if isinstance(other, RectangleArray) else RectangleArray(other)
+        return ((self.x[:, None] < other.right) & (other.x < self.right[:, None]) &
+                (self.y[:, None] < other.bottom) & (other.y < self.bottom[:, None]))
+
+    def intersection(self, other):
+        """
+        Returns the rectangles clipped by other. other is a single rectangle,
+        or a RectangleArray of the same length, eg. the clip rectangle of
+        every row's parent.
+        """
+        x, y, right, bottom = self._columns(other)
+        new_x = numpy.maximum(self.x, x)
+        new_y = numpy.maximum(self.y, y)
+        width = numpy.minimum(self.right, right) - new_x
+        height = numpy.minimum(self.bottom, bottom) - new_y
+        empty = (width <= 0) | (height <= 0)
+        return RectangleArray.from_arrays(*[numpy.where(empty, 0, column)
+                                            for column in (new_x, new_y, width, height)])
+
+    clip = intersection
+
+    def bounds(self):
+        """Returns the smallest Rectangle that contains all of the rectangles"""
+        if not len(self.data):
+            return Rectangle()
+        x, y = self.x.min(), self.y.min()
+        return Rectangle([x, y], [self.right.max() - x, self.bottom.max() - y])
+
+    def areas(self):
+        return self.width*self.height
@@ -0,0 +1,143 @@
+import weakref
+from .structures import StructureBase, Position, Color, BorderRadius, Padding, Gradient, frozen
+
+
+def _load_image(image):
+    #Imported here, the surface module needs this one first
+    from .surface import WindowSurface
+    if isinstance(image, basestring):
+        return WindowSurface.image_cache.load(image)
+    return image
+
+
+def frozen_value(value):
+    """Returns value types frozen so that they can be shared."""
+    if isinstance(value, StructureBase):
+        return frozen(value)
+    return value
+
+
+class Style(object):
+    """
+    How a window looks, shared by every window that uses it. A window
+    reads each option from its style unless it was given its own value,
+    so changing an option of a style repaints all of the windows using it.
+
+    Font descriptions built from the options are kept in fonts and shared
+    by the windows of the style. Outlines and gradient patterns depend on
+    the size of each window and stay with the window.
+
+    Values are frozen when they are set, change them by assigning a new
+    value to the style.
+    """
+    border_width = 1
+    border_color = frozen(Color(0, 0, 0, 0))
+    background_color = frozen(Color(0, 0, 0, 0))
+    background_image = None
+    background_image_filter = 'none'
+    background_image_stretch_horizontal = False
+    background_image_stretch_vertical = False
+    background_image_keep_ratio = False
+    background_image_center_horizontal = True
+    background_image_center_vertical = True
+    background_image_offset = frozen(Position(0, 0))
+    gradient = frozen(Gradient())
+    border_radius = frozen(BorderRadius(1))
+    padding = frozen(Padding(0))
+    dashed_border = False
+    font_size = 12
+    font_style = 'normal'
+    font_weight = 'normal'
+    font_family = 'Sans'
+    word_wrap = 'word'
+    font_color = frozen(Color(0, 0, 0, 1))
+
+    #Every option and how values given for it are converted
+    converters = {'border_width': None,
+                  'border_color': Color.from_value,
+                  'background_color': Color.from_value,
+                  'background_image': _load_image,
+                  'background_image_filter': None,
+                  'background_image_stretch_horizontal': None,
+                  'background_image_stretch_vertical': None,
+                  'background_image_keep_ratio': None,
+                  'background_image_center_horizontal': None,
+                  'background_image_center_vertical': None,
+                  'background_image_offset': Position.from_value,
+                  'gradient': Gradient.from_value,
+                  'border_radius': BorderRadius.from_value,
+                  'padding': Padding.from_value,
+                  'dashed_border': None,
+                  'font_size': None,
+                  'font_style': None,
+                  'font_weight': None,
+                  'font_family': None,
+                  'word_wrap': None,
+                  'font_color': Color.from_value}
+
+    options = frozenset(converters)
+
+    def __init__(self, **values):
+        super(Style, self).__init__()
+        self.windows = weakref.WeakSet()
+        #(size, weight, style, family) -> pango font description
+        self.fonts = {}
+        for name, value in values.items():
+            if name not in self.options:
+                raise TypeError('{} is not a style option'.format(name))
+            object.__setattr__(self, name, frozen_value(self.convert(name, value)))
+
+    def __setattr__(self, name, value):
+        if name in self.options:
+            value = frozen_value(self.convert(name, value))
+            if getattr(self, name) != value:
+                super(Style, self).__setattr__(name, value)
+                self.restyle()
+        else:
+            super(Style, self).__setattr__(name, value)
+
+    def __delattr__(self, name):
+        super(Style, self).__delattr__(name)
+        if name in self.options:
+            self.restyle()
+
+    def __repr__(self):
+        return u'Style {}'.format(self.values())
+
+    @classmethod
+    def convert(cls, name, value):
+        """Converts a value given for an option to the type the option has."""
+        convert = cls.converters[name]
+        if convert is None:
+            return value
+        return convert(value)
+
+    def values(self):
+        """Returns the options that were set on this style."""
+        return dict((name, value) for name, value in self.__dict__.items()
+                    if name in self.options)
+
+    def copy(self, **values):
+        """Returns a new style with the options of this one, changed by the given ones."""
+        options = self.values()
+        options.update(values)
+        return self.__class__(**options)
+
+    def restyle(self):
+        """Repaints every window that uses the style."""
+        for window in list(self.windows):
+            window.invalidate()
+
+
+class StyleOption(object):
+    """
+    A window attribute read from the style of the window. Assigning it
+    gives the window its own value, deleting it goes back to the style.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, window, owner):
+        if window is None:
+            return getattr(Style, self.name)
+        return getattr(window.style, self.name)
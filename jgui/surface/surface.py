@@ -3,20 +3,96 @@ import pango
 import pangocairo as pc
 import gtk
 import math
-from .structures import Size, Position, Rectangle, Color, BorderRadius, Padding, Gradient, RadialGradient
-from ..events.events import WindowEventSource
-from ..logger import log
-from datetime import datetime
+import collections
+import threading
+import weakref
+from .structures import Size, Position, Rectangle, Color, BorderRadius, Padding, Gradient, RadialGradient, frozen
+from .cache import LRUCache, ImageCache
+from .stats import FrameStats, timed
+from ..clock import clock
+from .spatial import SpatialIndex
+from .zorder import ZOrderList
+from .style import Style, StyleOption
+from .scene import SceneStore
+from ..events.events import WindowEventSource, propagate
+from ..logger import log, traced
 from jgui.settings import DEBUG as debug
 
 
 class Surface(WindowEventSource):
-    def __init__(self, size=None, context=None, data=None, render_mouse=True, show_fps=False):
+    types = WindowEventSource.types + ['redraw-needed', 'children-add',
+                                       'children-remove', 'children-reorder']
+    max_damage_rectangles = 32
+
+    def __init__(self, size=None, context=None, data=None, render_mouse=True, show_fps=False, damage_tracking=False, renderer=None, frame_stats=None, route_mouse_moves=False, scene_store=False, wakeup=None):
         super(Surface, self).__init__()
         self.show_fps = show_fps
         self.size = Size.from_value(size)
         self.mouse_pos = Position()
         self.drawing = False
+
+        #When damage tracking is on, windows report the areas they change
+        #and draw only repaints those instead of the whole surface
+        self.damage_tracking = damage_tracking
+        self.damaged = []
+        self.full_redraw = True
+        self.redraw_region = None
+        #The region the scene store last culled and the windows it found
+        self.culled = None
+        #The context draw_text last drew into and its pangocairo wrapper
+        self.text_context = None
+        #Set whenever anything changes and cleared by draw. Hosts can
+        #check it, or listen for 'redraw-needed', to only draw when needed.
+        self.needs_redraw = True
+
+        #Optional object that rasterizes the windows instead of drawing
+        #them straight into the context, eg. a TiledRenderer
+        self.renderer = renderer
+
+        #FrameStats that times every frame, None turns profiling off. It's
+        #created on demand when the fps counter is shown.
+        self.frame_stats = frame_stats
+
+        #Windows that are added, removed or raised are repainted
+        for event in ('children-add', 'children-remove', 'children-reorder'):
+            self.accept(event, self.children_changed)
+
+        #Windows of the root window's tree, looked up by mouse_inside
+        self.spatial_index = SpatialIndex()
+        self.spatial_index.watch(self)
+
+        #Optional SceneStore that keeps the geometry of the windows in numpy
+        #arrays, for queries and changes over the whole scene at once
+        self.scene_store = SceneStore() if scene_store else None
+        if self.scene_store is not None:
+            self.scene_store.watch(self)
+
+        #When routing mouse moves, only the hovered window, the window being
+        #dragged and tracking windows get them instead of every window in
+        #the tree
+        self.route_mouse_moves = route_mouse_moves
+        #The windows the mouse is in when routing, from the root down to the
+        #hovered window
+        self.hover_path = []
+        self.mouse_trackers = set()
+        #Windows that have the focus, the ones a mouse button can be held on
+        self.focused_windows = set()
+
+        #Raw input queued by hosts from any thread, handled in order at the
+        #start of the next draw
+        self.input_queue = collections.deque()
+        self.input_lock = threading.Lock()
+        self.input_received = 0
+        self.input_processed = 0
+        #clock() time the last handled input was queued at, or given by the host
+        self.input_timestamp = None
+        #The thread that draws, 'redraw-needed' is only dispatched on it
+        self.thread = threading.current_thread()
+        #Called without arguments on another thread when input queued there
+        #needs a frame. It has to hand the wakeup over to the host's loop,
+        #eg. with gobject.idle_add, and the loop then calls draw.
+        self.wakeup = wakeup
+
         if context is None:
             if data is not None:
                 self.csurface = cairo.ImageSurface.create_for_data(data, cairo.FORMAT_ARGB32, self.size.width, self.size.height)
@@ -31,37 +107,49 @@ class Surface(WindowEventSource):
             self.mouse_icon = Mouse('mouse', position=Position(0, 0), size=Size(12,20), context=self.context, surface=self)
         self.fps_counter = TextWindow('fps', '0 fps', position=Position(self.size.width-70, 10), size=Size(80,20), context=self.context, surface=self)
         self.windows = [self.root_window, self.mouse_icon, self.fps_counter]
+        self.spatial_index.add_tree(self.root_window)
+        if self.scene_store is not None:
+            self.scene_store.add_tree(self.root_window)
 
         self.current_hover_window = self.root_window
+        #Resize handle of the hovered window under the mouse
+        self.current_hover_handle = None
         self.current_focused_window = self.root_window
 
-        self.dt = 0
-        self.old_time = datetime.now()
-        self.dtindex = 0
-        self.max_samples = 60
-        self.dtlist = [0]*self.max_samples
-
         self.accept('mouse-move', self.process_mouse_move)
 
+    def children_changed(self, children, window):
+        window.invalidate_tree()
+
     def setTopZero(self, context):
         context.identity_matrix()
         matrix = cairo.Matrix(1, 0, 0,
                               1, 0, 0)
         context.transform(matrix)
 
+    @traced('input')
+    @timed('input')
     def inject_mouse_down(self, button):
         self.current_focused_window = self.current_hover_window
         self.root_window.inject_mouse_down(button)
 
+    @traced('input')
+    @timed('input')
     def inject_mouse_double(self, button):
         self.root_window.inject_mouse_double(button)
 
+    @traced('input')
+    @timed('input')
     def inject_mouse_wheel(self, value):
         self.root_window.inject_mouse_wheel(value)
 
+    @traced('input')
+    @timed('input')
     def inject_mouse_up(self, button):
         self.root_window.inject_mouse_up(button)
 
+    @traced('input')
+    @timed('input')
     def inject_mouse_position(self, pos):
         mouse_pos = Position.from_value(pos)
         diff = mouse_pos - self.mouse_pos
@@ -72,45 +160,165 @@ class Surface(WindowEventSource):
 
         if self.render_mouse:
             self.mouse_icon.position = pos
-        self.root_window.inject_mouse_position(pos)
+        if self.route_mouse_moves:
+            self.route_mouse_position(mouse_pos)
+        else:
+            self.root_window.inject_mouse_position(mouse_pos)
 
-    def mouse_inside(self):
+    def route_mouse_position(self, mouse_pos):
+        """
+        Sends the mouse position to the windows that can react to it, after
+        entering and leaving the windows the path to the hovered one changed.
+        """
+        self.update_hover_path()
+        targets = [self.current_hover_window]
+        if self.current_focused_window.mouse_down:
+            targets.append(self.current_focused_window)
+        targets.extend(self.mouse_trackers)
+
+        seen = set()
+        for window in targets:
+            if window is not None and window not in seen:
+                seen.add(window)
+                window.move_mouse(mouse_pos)
+
+    def update_hover_path(self):
         """
-        Checks if the mouse is inside the window taking into account
-        all other windows and draw priorities.
+        Compares the path from the root to the hovered window with the last
+        one. The windows only on the old path are left, from the bottom up,
+        and the ones only on the new path are entered, from the top down.
         """
+        hovered = self.current_hover_window
+        path = hovered.path_from_root() if hovered is not None else []
+        old_path = self.hover_path
+        common = 0
+        for old, new in zip(old_path, path):
+            if old is not new:
+                break
+            common += 1
+        for window in reversed(old_path[common:]):
+            window.mouse_in = False
+            log('mouse-leave', window.name)
+            window.dispatch('mouse-leave', window)
+        for window in path[common:]:
+            window.mouse_in = True
+            log('mouse-enter', window.name)
+            window.dispatch('mouse-enter', window)
+            window.dispatch('hover', window)
+        self.hover_path = path
+
+    def track_mouse_moves(self, window):
+        """Makes the window get every mouse move when moves are routed."""
+        self.mouse_trackers.add(window)
+
+    def untrack_mouse_moves(self, window):
+        self.mouse_trackers.discard(window)
+
+    def queue_mouse_down(self, button, timestamp=None):
+        self._queue_input('mouse_down', button, timestamp)
+
+    def queue_mouse_double(self, button, timestamp=None):
+        self._queue_input('mouse_double', button, timestamp)
+
+    def queue_mouse_wheel(self, value, timestamp=None):
+        self._queue_input('mouse_wheel', value, timestamp)
+
+    def queue_mouse_up(self, button, timestamp=None):
+        self._queue_input('mouse_up', button, timestamp)
+
+    def queue_mouse_position(self, pos, timestamp=None):
+        self._queue_input('mouse_position', pos, timestamp)
+
+    def _queue_input(self, event, value, timestamp):
+        """
+        Queues an input event instead of injecting it right away. Consecutive
+        mouse moves are merged, so only the last position gets handled.
 
-        #Check all children of root to see if there is a higher priority
-        #window than the current one
-        root = self.root_window
-        stack = [root]
-        visited = set()
-        while stack:
-            item = stack[-1]
-            rec = item.rectangle
-            clip_parent = item.get_clip_parent()
-            if clip_parent is not None:
-                rec = item.rectangle.intersection(clip_parent.rectangle)
-            intersects_mouse = rec.intersects_with(self.mouse_pos)
-            if item.children and not set(item.children).issubset(visited):
-                stack.extend(item.children)
-            else:
-                if intersects_mouse:
-                    return item
-                visited.add(item)
-                stack.pop()
+        timestamp: when the input happened in clock() seconds, the time it's
+                   queued at by default. Host event times, like the server
+                   milliseconds of GTK events, are on another clock and
+                   can't be compared with it.
+        """
+        if timestamp is None:
+            timestamp = clock()
+        with self.input_lock:
+            queue = self.input_queue
+            self.input_received += 1
+            if event == 'mouse_position' and queue and queue[-1][0] == event:
+                queue[-1] = (event, value, timestamp)
+                return
+            queue.append((event, value, timestamp))
+            wake = len(queue) == 1 and not self.needs_redraw
+        #Hosts that only draw on demand have to draw to get the input handled.
+        #Listeners expect to be called on the drawing thread, so other
+        #threads go through wakeup instead.
+        if wake:
+            if threading.current_thread() is self.thread:
+                self.dispatch('redraw-needed', self)
+            elif self.wakeup is not None:
+                self.wakeup()
+
+    def process_input(self):
+        """
+        Injects the queued input in the order it arrived. draw calls it
+        first, hosts can call it earlier on their own tick. Returns the
+        number of events handled.
+        """
+        with self.input_lock:
+            if not self.input_queue:
+                return 0
+            events = self.input_queue
+            self.input_queue = collections.deque()
+
+        for event, value, timestamp in events:
+            getattr(self, 'inject_' + event)(value)
+            self.input_timestamp = timestamp
+        self.input_processed += len(events)
+        return len(events)
+
+    @timed('hit-test')
+    def mouse_inside(self):
+        """
+        Returns the topmost visible window under the mouse, taking into
+        account the windows that clip their children.
+        """
+        if self.scene_store is not None:
+            return self.scene_store.window_at(self.mouse_pos)
+        return self.spatial_index.window_at(self.mouse_pos)
 
-        return None
+    def paints_in(self, window, region):
+        """
+        Checks if drawing the window touches the region. With a scene store
+        the windows it has are culled all at once, the first time a region
+        is asked about.
+        """
+        store = self.scene_store
+        if store is not None and window.image_bounds is None and window in store:
+            if self.culled is None or self.culled[0] is not region:
+                self.culled = (region, store.painted_in(region))
+            return window in self.culled[1]
+        return window.paint_rectangle().overlaps_any(region)
 
     def process_mouse_move(self, obj, old_mpos, new_mpos):
         if not self.current_hover_window or not self.current_hover_window.mouse_down:
             self.current_hover_window = self.mouse_inside()
+            if self.current_hover_window is not None:
+                self.current_hover_handle = self.current_hover_window.handle_at(self.mouse_pos)
+            else:
+                self.current_hover_handle = None
+
+    def close(self):
+        """Releases what the surface holds outside of Python, like the threads of its renderer."""
+        close = getattr(self.renderer, 'close', None)
+        if close is not None:
+            close()
 
     def notify_window_resize(self, width, height):
         self.size = Size(width, height)
         self.root_window.size = self.size
         self.csurface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.size.width, self.size.height)
         self.context = cairo.Context(self.csurface)
+        self.invalidate()
 
         stack = self.windows[:]
         while stack:
@@ -119,29 +327,83 @@ class Surface(WindowEventSource):
             if item.children:
                 stack.extend(item.children)
 
-    def calcfps(self, dt):
-        self.dtlist[self.dtindex] = float(dt)
-        self.dtindex += 1
-        if self.dtindex >= self.max_samples:
-            self.dtindex = 0
-
-        return 1.0/(sum(self.dtlist)/float(self.max_samples))
-
+    def invalidate(self, rectangle=None):
+        """
+        Marks an area of the surface as needing a repaint on the next draw.
+        Without a rectangle, or when damage tracking is off, the whole
+        surface is repainted.
+        """
+        if not self.needs_redraw:
+            self.needs_redraw = True
+            self.dispatch('redraw-needed', self)
+
+        if rectangle is None:
+            self.full_redraw = True
+            self.damaged = []
+        elif self.damage_tracking and not self.full_redraw:
+            rectangle = Rectangle.from_value(rectangle)
+            if rectangle.size.width <= 0 or rectangle.size.height <= 0:
+                return
+            for rec in self.damaged:
+                if rec.contains(rectangle):
+                    return
+            self.damaged.append(rectangle)
+            if len(self.damaged) > self.max_damage_rectangles:
+                self.damaged = [Rectangle.bounds(self.damaged)]
+
+    @traced('frame')
     def draw(self):
+        """
+        Draws everything that changed since the last draw. Returns False
+        right away, without touching the surface, when nothing changed.
+        Queued input is handled first.
+        """
+        self.process_input()
+        if not self.needs_redraw:
+            return False
+
         self.drawing = True
-        if self.show_fps:
-            self.dt = (datetime.now() - self.old_time).total_seconds()
-            self.old_time = datetime.now()
-            fps = self.calcfps(self.dt)
-            self.fps_counter.text = '{} fps'.format(round(fps))
-
-        self.context.set_operator(cairo.OPERATOR_CLEAR)
-        self.context.rectangle(0.0, 0.0, self.size.width, self.size.height)
-        self.context.fill()
-        self.context.set_operator(cairo.OPERATOR_OVER)
-        for window in self.windows:
-            window.draw()
-        self.drawing = False
+        if self.show_fps and self.frame_stats is None:
+            self.frame_stats = FrameStats()
+        stats = self.frame_stats
+        if stats is not None:
+            stats.begin_frame()
+            stats.start('traversal')
+        context = self.context
+        context.save()
+        #A window failing to render must not leave the surface drawing,
+        #the stats section open or the cairo state saved
+        try:
+            if self.show_fps:
+                self.fps_counter.text = '{} fps'.format(round(stats.fps()))
+
+            if self.damage_tracking and not self.full_redraw:
+                self.redraw_region = self.damaged
+            self.damaged = []
+            self.full_redraw = False
+            self.needs_redraw = False
+
+            if self.redraw_region is not None:
+                #Only the union of the damaged rectangles gets cleared and painted
+                for rec in self.redraw_region:
+                    context.rectangle(rec.position.x, rec.position.y, rec.size.width, rec.size.height)
+                context.clip()
+            context.set_operator(cairo.OPERATOR_CLEAR)
+            context.rectangle(0.0, 0.0, self.size.width, self.size.height)
+            context.fill()
+            context.set_operator(cairo.OPERATOR_OVER)
+            if self.renderer is not None:
+                self.renderer.render(self, self.redraw_region)
+            else:
+                for window in self.windows:
+                    window.draw()
+        finally:
+            context.restore()
+            self.redraw_region = self.culled = None
+            if stats is not None:
+                stats.stop()
+            self.drawing = False
+        return True
 
 
 class WindowSurface(object):
@@ -184,13 +446,38 @@ class WindowSurface(object):
                'gaussian': cairo.FILTER_GAUSSIAN,
                'nearest' : cairo.FILTER_NEAREST}
 
+    #Rendered images of windows flagged as layers, shared by all surfaces
+    layer_cache = LRUCache(64*1024*1024)
+
+    #Keep the outlines built by draw_rounded_rect between frames
+    cache_paths = True
+    max_cached_paths = 4
+
+    #Decoded image files, shared by every window that uses the same path
+    image_cache = ImageCache(gtk.gdk.pixbuf_new_from_file,
+                             lambda image: image.get_rowstride()*image.get_height())
+
+    #Images already scaled to the size they get drawn at
+    scaled_image_cache = LRUCache(64*1024*1024)
+
+    #The attributes below are slots of Window, a class can only get slots
+    #from one of its bases
+    __slots__ = ()
+
     def __init__(self):
         super(WindowSurface, self).__init__()
+        #Pango state kept between frames by draw_text
+        self.text_layout = None
+        self.text_layout_key = None
+        #Outlines kept between frames by draw_rounded_rect, made on first use
+        self.path_cache = None
+        #Gradient pattern kept between frames and the inputs it was built from
+        self.gradient_cache = None
 
     def load_image(self, image_path):
         if image_path is not None:
             if isinstance(image_path, basestring):
-                return gtk.gdk.pixbuf_new_from_file(image_path)
+                return self.image_cache.load(image_path)
             else:
                 return image_path
 
@@ -203,8 +490,8 @@ class WindowSurface(object):
         width = size.width
         height = size.height
 
-        x,y = (self.position.x+position.x+width/2,
-               self.position.y+position.y+height/2)
+        x,y = (position.x+width/2,
+               position.y+height/2)
 
         context.set_line_width(line_width)
 
@@ -234,8 +521,7 @@ class WindowSurface(object):
         width = size.width
         height = size.height
 
-        x,y = (self.position.x+position.x,
-               self.position.y+position.y)
+        x,y = position.x, position.y
 
         if isinstance(image, basestring):
             image = self.load_image(image)
@@ -261,21 +547,12 @@ class WindowSurface(object):
 
         if center_horizontal:
             x += width/2.0 - new_width/2.0
-            if x < self.position.x:
-                x = self.position.x
+            if x < 0:
+                x = 0
         if center_vertical:
             y += height/2.0 - new_height/2.0
-            if y < self.position.y:
-                y = self.position.y
-
-        im_surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(new_width), int(new_height))
-
-        sp = cairo.SurfacePattern(im_surf)
-
-        ct2 = cairo.Context(im_surf)
-        ct2.set_source(sp)
-
-        ct3 = gtk.gdk.CairoContext(ct2)
+            if y < 0:
+                y = 0
 
         new_scale_x = 1
         new_scale_y = 1
@@ -285,15 +562,36 @@ class WindowSurface(object):
         if stretch_vertical or keep_ratio:
             new_scale_y = new_height/float(im_height)
 
-        ct3.scale(new_scale_x, new_scale_y)
+        #Centering only moves the image around, so it isn't part of the key
+        key = (image, int(new_width), int(new_height), filter,
+               new_scale_x, new_scale_y, offset.x, offset.y)
+        im_surf = self.scaled_image_cache.get(key)
+
+        if im_surf is None:
+            im_surf = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(new_width), int(new_height))
+
+            sp = cairo.SurfacePattern(im_surf)
+
+            ct2 = cairo.Context(im_surf)
+            ct2.set_source(sp)
+
+            ct3 = gtk.gdk.CairoContext(ct2)
 
-        ct3.set_source_pixbuf(image, -offset.x, -offset.y)
-        ct3.get_source().set_filter(self.filters[filter])
-        ct3.paint()
+            ct3.scale(new_scale_x, new_scale_y)
+
+            ct3.set_source_pixbuf(image, -offset.x, -offset.y)
+            ct3.get_source().set_filter(self.filters[filter])
+            ct3.paint()
+
+            self.scaled_image_cache.put(key, im_surf, im_surf.get_stride()*int(new_height))
 
         context.set_source_surface(im_surf,x,y)
         context.paint()
 
+        #Images may spill outside of the window, so remember where it went
+        #for damage tracking
+        self.image_bounds = Rectangle([x, y], [int(new_width), int(new_height)])
+
 
     def draw_text(self, text, position, font_size=12,
                   font_weight='normal',
@@ -303,33 +601,48 @@ class WindowSurface(object):
                   background_color=(1,1,1,0), fill_color=None):
 
         color = Color.from_value(font_color)
-        background_color = Color.from_value(background_color)
         position = Position.from_value(position)
         context = self.surface.context
-        font_weight = self.font_weights[font_weight]
-        font_style = self.font_styles[font_style]
 
-        pc_context = pc.CairoContext(context)
+        #The layout is kept by the window and the pango wrapper of the
+        #context by the surface, only the wrapper is made again when the
+        #context changes, eg. every frame of a TiledRenderer
+        surface = self.surface
+        if surface.text_context is None or surface.text_context[0] is not context:
+            surface.text_context = (context, pc.CairoContext(context))
+        pc_context = surface.text_context[1]
         pc_context.set_antialias(cairo.ANTIALIAS_SUBPIXEL)
-        layout = pc_context.create_layout()
-        font = pango.FontDescription('{} {}'.format(font_family, font_size))
-        font.set_weight(font_weight)
-        font.set_style(font_style)
-
-        layout.set_font_description(font)
-        layout.set_text(text)
-        layout.set_wrap(self.wrap_modes[word_wrap])
-        width = self.size.width - (self.padding.left + self.padding.right)
-        layout.set_width(int(width*pango.SCALE))
-        layout.set_alignment(alignment)
 
-        context.set_line_width(line_width)
-        context.set_source_rgba(font_color.r, font_color.g, font_color.b, font_color.a)
+        #The layout only needs to be set up again when something that
+        #changes how the text is laid out changes
+        width = int((self.size.width - (self.padding.left + self.padding.right))*pango.SCALE)
+        key = (text, font_size, font_weight, font_style, font_family, word_wrap, alignment, width)
+        if self.text_layout is None:
+            self.text_layout = pc_context.create_layout()
+        layout = self.text_layout
+        old_key = self.text_layout_key
+        if key != old_key:
+            if old_key is None or key[1:5] != old_key[1:5]:
+                fonts = self.style.fonts
+                font = fonts.get(key[1:5])
+                if font is None:
+                    font = pango.FontDescription('{} {}'.format(font_family, font_size))
+                    font.set_weight(self.font_weights[font_weight])
+                    font.set_style(self.font_styles[font_style])
+                    fonts[key[1:5]] = font
+                layout.set_font_description(font)
+
+            layout.set_text(text)
+            layout.set_wrap(self.wrap_modes[word_wrap])
+            layout.set_width(width)
+            layout.set_alignment(alignment)
+            self.text_layout_key = key
 
-        extents = context.text_extents(text)
+        context.set_line_width(line_width)
+        context.set_source_rgba(color.r, color.g, color.b, color.a)
 
-        x,y = (self.position.x+position.x+self.padding.left,
-               self.position.y+position.y+self.padding.top)
+        x,y = (position.x+self.padding.left,
+               position.y+self.padding.top)
 
         context.move_to(x, y)
         pc_context.update_layout(layout)
@@ -341,12 +654,10 @@ class WindowSurface(object):
             line_color = Color.from_value(line_color)
             background_color = Color.from_value(background_color)
             context = self.surface.context
-            start_pos = self.position + lines[0]
             context.set_line_width(line_width)
-            context.move_to(start_pos.x, start_pos.y)
+            context.move_to(*lines[0])
             for line in lines[1:]:
-                next_pos = self.position+line
-                context.line_to(next_pos.x, next_pos.y)
+                context.line_to(*line)
             context.close_path()
             try:
                 context.set_line_cap(self.line_joins[line_join])
@@ -361,44 +672,113 @@ class WindowSurface(object):
             context.set_source_rgba(line_color.r, line_color.g, line_color.b, line_color.a)
             context.stroke()
 
+    def gradient_pattern(self, gradient, inner_radius=None, outer_radius=None):
+        """
+        Returns the cairo pattern for a gradient stretched over the window.
+        The pattern is built in window coordinates and kept until the
+        values of the gradient or the size of the window change.
+        """
+        size = self.size
+        key = (gradient.key(), size.width, size.height, inner_radius, outer_radius)
+        cached = self.gradient_cache
+        if cached is not None and cached[0] == key:
+            pattern = cached[1]
+        else:
+            width = float(size.width)
+            height = float(size.height)
+            if gradient._type == 'radial':
+                pattern = cairo.RadialGradient(gradient.start_position.x*width,
+                                               gradient.start_position.y*height,
+                                               inner_radius,
+                                               gradient.end_position.x*width,
+                                               gradient.end_position.y*height,
+                                               outer_radius)
+            else:
+                pattern = cairo.LinearGradient(gradient.start_position.x*width,
+                                               gradient.start_position.y*height,
+                                               gradient.end_position.x*width,
+                                               gradient.end_position.y*height)
+            for gstop in gradient.stops:
+                pattern.add_color_stop_rgba(gstop.offset, gstop.color.r, gstop.color.g,
+                                            gstop.color.b, gstop.color.a)
+            self.gradient_cache = (key, pattern)
+        return pattern
+
     def render_radial_gradient(self, gradient, inner_radius=None, outer_radius=None):
         context = self.surface.context
-        position = self.position
-        size = self.size
         gradient = RadialGradient.from_value(gradient)
-        rp = cairo.RadialGradient(gradient.start_position.x*float(size.width) + position.x,
-                                  gradient.start_position.y*float(size.height) + position.y,
-                                  inner_radius or gradient.inner_radius,
-                                  gradient.end_position.x*float(size.width) + position.x,
-                                  gradient.end_position.y*float(size.height) + position.y,
-                                  outer_radius or gradient.outer_radius)
-        for gstop in gradient.stops:
-            rp.add_color_stop_rgba(gstop.offset, gstop.color.r, gstop.color.g,
-                                   gstop.color.b, gstop.color.a)
         if gradient.stops:
             context.save()
-            context.set_source(rp)
+            context.set_source(self.gradient_pattern(gradient,
+                                                     inner_radius or gradient.inner_radius,
+                                                     outer_radius or gradient.outer_radius))
             context.fill_preserve()
             context.restore()
 
     def render_linear_gradient(self, gradient):
         context = self.surface.context
-        position = self.position
-        size = self.size
         gradient = Gradient.from_value(gradient)
-        lp = cairo.LinearGradient(gradient.start_position.x*float(size.width) + position.x,
-                                  gradient.start_position.y*float(size.height) + position.y,
-                                  gradient.end_position.x*float(size.width) + position.x,
-                                  gradient.end_position.y*float(size.height) + position.y)
-        for gstop in gradient.stops:
-            lp.add_color_stop_rgba(gstop.offset, gstop.color.r, gstop.color.g,
-                                   gstop.color.b, gstop.color.a)
         if gradient.stops:
             context.save()
-            context.set_source(lp)
+            context.set_source(self.gradient_pattern(gradient))
             context.fill_preserve()
             context.restore()
 
+    def rounded_rect_path(self, x, y, width, height, radius, line_width, inset=0):
+        """
+        Adds a rounded rectangle to the current path. The outline is built
+        relative to its corner and kept, so later calls with the same
+        geometry only have to append it at the new position.
+        """
+        context = self.surface.context
+        key = (width, height, tuple(radius), line_width, inset)
+        path_cache = self.path_cache
+        path = path_cache.get(key) if path_cache is not None else None
+
+        if path is None and self.cache_paths:
+            #Built in a path of its own, so that the kept outline doesn't
+            #take in what was already in the current path
+            current = context.copy_path()
+            context.new_path()
+            self.rounded_rect_outline(width, height, radius, line_width, inset)
+            path = context.copy_path()
+            #Resizing creates a new outline every frame, so don't keep
+            #more than a few around
+            if path_cache is None:
+                path_cache = self.path_cache = {}
+            elif len(path_cache) >= self.max_cached_paths:
+                path_cache.clear()
+            path_cache[key] = path
+            context.new_path()
+            context.append_path(current)
+
+        context.save()
+        context.translate(x, y)
+        if path is not None:
+            context.append_path(path)
+        else:
+            self.rounded_rect_outline(width, height, radius, line_width, inset)
+        context.restore()
+
+    def rounded_rect_outline(self, width, height, radius, line_width, inset=0):
+        """Adds the outline of a rounded rectangle at the origin as a new sub path."""
+        context = self.surface.context
+        degrees = math.pi / 180.0
+        context.new_sub_path()
+        context.arc(width - radius.topright - line_width/2.0,
+                    radius.topright + line_width/2.0,
+                    radius.topright - inset, -90 * degrees, 0 * degrees)
+        context.arc(width - radius.bottomright - line_width/2.0,
+                    height - radius.bottomright - line_width/2.0,
+                    radius.bottomright - inset, 0 * degrees, 90 * degrees)
+        context.arc(radius.bottomleft + line_width/2.0,
+                    height - radius.bottomleft - line_width/2.0,
+                    radius.bottomleft - inset, 90 * degrees, 180 * degrees)
+        context.arc(radius.topleft + line_width/2.0,
+                    radius.topleft + line_width/2.0,
+                    radius.topleft - inset, 180 * degrees, 270 * degrees)
+        context.close_path()
+
     def draw_rounded_rect(self, position, size, background_color=(1,1,1), line_width=1, line_color=(0,0,0), corner_radius=0, line_dashed=False, clip=False, gradient=()):
         position = Position.from_value(position)
         size = Size.from_value(size)
@@ -409,9 +789,8 @@ class WindowSurface(object):
 
         context = self.surface.context
         radius = corner_radius
-        degrees = math.pi / 180.0
-        x = position.x + self.position.x
-        y = position.y + self.position.y
+        x = position.x
+        y = position.y
         width = size.width
         height = size.height
 
@@ -421,19 +800,7 @@ class WindowSurface(object):
             context.clip()
 
         context.new_path()
-        context.arc(x + width - radius.topright - line_width/2.0,
-                    y + radius.topright + line_width/2.0,
-                    radius.topright, -90 * degrees, 0 * degrees)
-        context.arc(x + width - radius.bottomright - line_width/2.0,
-                    y + height - radius.bottomright - line_width/2.0,
-                    radius.bottomright, 0 * degrees, 90 * degrees)
-        context.arc(x + radius.bottomleft + line_width/2.0,
-                    y + height - radius.bottomleft - line_width/2.0,
-                    radius.bottomleft, 90 * degrees, 180 * degrees)
-        context.arc(x + radius.topleft + line_width/2.0,
-                    y + radius.topleft + line_width/2.0,
-                    radius.topleft, 180 * degrees, 270 * degrees)
-        context.close_path()
+        self.rounded_rect_path(x, y, width, height, radius, line_width)
 
         if gradient.stops:
             if gradient._type == 'linear':
@@ -456,19 +823,7 @@ class WindowSurface(object):
 
         if clip: #clips the entire region so any child windows will be confined to the parent
             context.new_path()
-            context.arc(x + width - radius.topright - line_width/2.0,
-                        y + radius.topright + line_width/2.0,
-                        radius.topright-self.border_width/2.0, -90 * degrees, 0 * degrees)
-            context.arc(x + width - radius.bottomright - line_width/2.0,
-                        y + height - radius.bottomright - line_width/2.0,
-                        radius.bottomright-self.border_width/2.0, 0 * degrees, 90 * degrees)
-            context.arc(x + radius.bottomleft + line_width/2.0,
-                        y + height - radius.bottomleft - line_width/2.0,
-                        radius.bottomleft-self.border_width/2.0, 90 * degrees, 180 * degrees)
-            context.arc(x + radius.topleft + line_width/2.0,
-                        y + radius.topleft + line_width/2.0,
-                        radius.topleft-self.border_width/2.0, 180 * degrees, 270 * degrees)
-            context.close_path()
+            self.rounded_rect_path(x, y, width, height, radius, line_width, self.border_width/2.0)
             context.clip()
 
 
@@ -476,63 +831,202 @@ class WindowSurface(object):
         if debug and not self.ignore_debug:
             self.draw_rounded_rect([0,0], [self.size.width, self.size.height], background_color=(0,0,1,0.1), line_color=(0,0,1,0.4), line_width=self.border_width+0.5, corner_radius=self.border_radius, line_dashed=True)
 
+    @traced('render', 'render')
+    def _timed_render(self):
+        stats = self.surface.frame_stats
+        if stats is None:
+            self.render()
+        else:
+            stats.start('render')
+            try:
+                self.render()
+            finally:
+                stats.add_window(self, stats.stop())
+
+    def draw_layer(self):
+        """
+        Draws the window and its children from a cached image that is only
+        rendered again when something inside of the layer changes. Layers
+        are clipped to the window's paint rectangle. The context has to be
+        translated to the window already.
+        """
+        bounds = self.paint_rectangle()
+        position = self.absolute_position
+        x = math.floor(bounds.position.x)
+        y = math.floor(bounds.position.y)
+        width = int(math.ceil(bounds.position.x + bounds.size.width - x))
+        height = int(math.ceil(bounds.position.y + bounds.size.height - y))
+        #Where the image goes relative to the window, kept on whole pixels
+        x -= position.x
+        y -= position.y
+        #The cache is shared by every window, it mustn't keep them alive
+        key = (weakref.ref(self), self.layer_version, width, height)
+
+        entry = self.layer_cache.get(key)
+        if entry is None:
+            if self.layer_key is not None:
+                self.layer_cache.discard(self.layer_key)
+            image = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            context = cairo.Context(image)
+            context.translate(-x, -y)
+
+            surface = self.surface
+            main_context, region = surface.context, surface.redraw_region
+            surface.context, surface.redraw_region = context, None
+            try:
+                self._timed_render()
+                for child in self.children:
+                    child.draw()
+            finally:
+                surface.context, surface.redraw_region = main_context, region
+
+            entry = (image, x, y)
+            self.layer_cache.put(key, entry, image.get_stride()*height)
+            self.layer_key = key
+
+        image, x, y = entry
+        context = self.surface.context
+        context.save()
+        context.set_source_surface(image, x, y)
+        context.rectangle(x, y, width, height)
+        context.fill()
+        context.restore()
+
+    @traced('draw')
     def draw(self):
         if self.visible:
-            self.surface.context.save()
-            self.render()
-            for child in self.children:
-                child.draw()
-            self.surface.context.restore()
+            region = self.surface.redraw_region
+            damaged = region is None or self.surface.paints_in(self, region)
+            #Children of a clipping window can't be seen outside of it, so the
+            #whole subtree can be skipped when it isn't damaged
+            if damaged or not (self.clip_children or self.layer):
+                #Windows draw in their own coordinates, with their children
+                #translated along with them
+                context = self.surface.context
+                context.save()
+                try:
+                    context.translate(self.position.x, self.position.y)
+                    if self.layer:
+                        self.draw_layer()
+                    else:
+                        if damaged:
+                            self._timed_render()
+                        for child in self.children:
+                            child.draw()
+                finally:
+                    context.restore()
 
 
 class Window(WindowEventSource, WindowSurface):
+    #Attributes that change how the window looks. Setting any of them
+    #invalidates the area covered by the window.
+    visual_attributes = frozenset(['border_width', 'border_color', 'background_color',
+                                   'background_image', 'background_image_filter',
+                                   'background_image_stretch_horizontal',
+                                   'background_image_stretch_vertical',
+                                   'background_image_keep_ratio',
+                                   'background_image_center_horizontal',
+                                   'background_image_center_vertical',
+                                   'background_image_offset', 'gradient',
+                                   'border_radius', 'padding', 'dashed_border',
+                                   'clip_children', 'visible'])
+
+    #Attributes that change where the window can be hit by the mouse
+    hit_attributes = frozenset(['clip_children', 'visible'])
+
+    #Extra space around the window that rendering may touch, eg. antialiasing
+    paint_margin = 2
+
+    #State every window has. Anything else, like the options below that
+    #were changed from their defaults, goes in __dict__.
+    __slots__ = ('name', 'parent', 'children', 'rectangle', '_surface', '_root',
+                 '_absolute_position', '_draggable', '_resizable',
+                 'active_handle', 'handle_diff', 'mouse_pos', 'mouse_diff',
+                 'mouse_in', 'mouse_hover', 'mouse_down', 'mouse_inputs',
+                 'focused', 'image_bounds', 'layer_version', 'layer_key',
+                 'text_layout', 'text_layout_key',
+                 'path_cache', 'gradient_cache', '_style',
+                 '__dict__', '__weakref__')
+
+    #Defaults shared by every window, a window only gets its own value when
+    #it's given one. They are frozen, so assign new values instead of
+    #changing them in place.
+    min_size = frozen(Size(1, 1))
+    max_size = frozen(Size(-1, -1))
+    corner_handle_size = frozen(Size(20, 20))
+    edge_handle_width = 10
+    edge_handle_buffer = frozen(Size(5, 5))
+    clip_children = False
+    ignore_debug = False
+    layer = False
+    visible = True
+
+    #How the values given to __init__ for the defaults above are converted
+    default_converters = {'min_size': Size.from_value,
+                          'max_size': Size.from_value,
+                          'corner_handle_size': Size.from_value,
+                          'edge_handle_buffer': Size.from_value}
+
+    #Used by windows that aren't given a style
+    default_style = Style()
+
+    #Read from the style unless the window was given its own value
+    border_width = StyleOption('border_width')
+    border_color = StyleOption('border_color')
+    background_color = StyleOption('background_color')
+    background_image = StyleOption('background_image')
+    background_image_filter = StyleOption('background_image_filter')
+    background_image_stretch_horizontal = StyleOption('background_image_stretch_horizontal')
+    background_image_stretch_vertical = StyleOption('background_image_stretch_vertical')
+    background_image_keep_ratio = StyleOption('background_image_keep_ratio')
+    background_image_center_horizontal = StyleOption('background_image_center_horizontal')
+    background_image_center_vertical = StyleOption('background_image_center_vertical')
+    background_image_offset = StyleOption('background_image_offset')
+    gradient = StyleOption('gradient')
+    border_radius = StyleOption('border_radius')
+    padding = StyleOption('padding')
+    dashed_border = StyleOption('dashed_border')
+
+    _no_offset = frozen(Position(0, 0))
+    #Shared until a mouse button goes down on the window
+    _no_mouse_inputs = dict.fromkeys(WindowEventSource.mouse_button_down_events, False)
+
     def __init__(self, name, **kwargs):
         super(Window, self).__init__()
         self._draggable = False
         self._resizable = False
+        #Name of the resize handle being dragged
+        self.active_handle = None
+        self.handle_diff = self._no_offset
         self._root = None
+        self.rectangle = Rectangle()
+        self._absolute_position = None
+        self.image_bounds = None
+        self.parent = None
+        self.layer_version = 0
+        self.layer_key = None
 
         self.name = name
 
         position = Position.from_value(kwargs.pop('position', Position()))
         size = Size.from_value(kwargs.pop('size', Size()))
         self._surface = kwargs.pop('surface', None)
-        self.min_size = Size.from_value(kwargs.pop('min_size', Size(1,1)))
-        self.max_size = Size.from_value(kwargs.pop('max_size', Size(-1,-1)))
-        self.corner_handle_size = Size.from_value(kwargs.pop('corner_handle_size', Size(20, 20)))
-        self.edge_handle_width = kwargs.pop('edge_handle_width', 10)
-        self.edge_handle_buffer = Size.from_value(kwargs.pop('edge_handle_buffer', Size(5, 5)))
-        self.border_width = kwargs.pop('border_width', 1)
-        self.border_color = Color.from_value(kwargs.pop('border_color', (0,0,0,0)))
-        self.background_color = Color.from_value(kwargs.pop('background_color', (0,0,0,0)))
-        self.background_image = self.load_image(kwargs.pop('background_image', None))
-        self.background_image_filter = kwargs.pop('background_image_filter','none')
-        self.background_image_stretch_horizontal = kwargs.pop('background_image_stretch_horizontal', False)
-        self.background_image_stretch_vertical = kwargs.pop('background_image_stretch_vertical', False)
-        self.background_image_keep_ratio = kwargs.pop('background_image_keep_ratio', False)
-        self.background_image_center_horizontal = kwargs.pop('background_image_center_horizontal', True)
-        self.background_image_center_vertical = kwargs.pop('background_image_center_vertical', True)
-        self.background_image_offset = Position.from_value(kwargs.pop('background_image_offset', (0, 0)))
-
-        self.gradient = Gradient.from_value(kwargs.pop('gradient', ()))
-
-        self.border_radius = BorderRadius.from_value(kwargs.pop('border_radius', 1))
-        self.padding = Padding.from_value(kwargs.pop('padding', 0))
-        self.dashed_border = kwargs.pop('dashed_border', False)
-        self.clip_children = kwargs.pop('clip_children', False)
-        self.ignore_debug = kwargs.pop('ignore_debug', False)
-
-        self.rectangle = Rectangle()
-        self.children = []
-        self.parent = None
+        self._style = kwargs.pop('style', None) or self.default_style
+        self._style.windows.add(self)
+        for key, convert in self.default_converters.items():
+            if key in kwargs:
+                setattr(self, key, convert(kwargs.pop(key)))
+        for key in Style.options.intersection(kwargs):
+            setattr(self, key, Style.convert(key, kwargs.pop(key)))
+
+        self.children = ZOrderList(owner=self)
         self.mouse_pos = Position(size.width/2, size.height/2)
-        self.mouse_diff = Position(0, 0)
+        self.mouse_diff = self._no_offset
         self.mouse_in = False
         self.mouse_hover = False
         self.mouse_down = False
-        self.mouse_inputs = dict.fromkeys(self.mouse_button_down_events, False)
+        self.mouse_inputs = self._no_mouse_inputs
         self.focused = False
-        self.visible = True
         self.accept('mouse-move', self.process_mouse_move)
         self.size = size
         self.position = position
@@ -543,6 +1037,105 @@ class Window(WindowEventSource, WindowSurface):
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+    def __setattr__(self, name, value):
+        if name in self.visual_attributes and getattr(self, name, None) != value:
+            super(Window, self).__setattr__(name, value)
+            self.invalidate()
+            if name in self.hit_attributes:
+                self.update_hit_area()
+        else:
+            super(Window, self).__setattr__(name, value)
+
+    def __delattr__(self, name):
+        super(Window, self).__delattr__(name)
+        if name in self.visual_attributes:
+            self.invalidate()
+            if name in self.hit_attributes:
+                self.update_hit_area()
+
+    def update_hit_area(self):
+        """Tells the surface that where the window and its children can be hit changed."""
+        surface = self._surface
+        if surface is not None:
+            surface.spatial_index.update_tree(self)
+            if surface.scene_store is not None:
+                surface.scene_store.update(self)
+
+    @property
+    def style(self):
+        """The shared Style the window reads the options it doesn't set itself from."""
+        return self._style
+
+    @style.setter
+    def style(self, style):
+        if style is not self._style:
+            self._style.windows.discard(self)
+            self._style = style
+            style.windows.add(self)
+            self.invalidate()
+
+    def paint_rectangle(self):
+        """Returns the area of the surface that drawing this window touches."""
+        rec = self.absolute_rectangle()
+        if self.image_bounds is not None:
+            rec = Rectangle.bounds([rec, Rectangle(self.image_bounds.position + rec.position,
+                                                   self.image_bounds.size)])
+        margin = self.paint_margin
+        return Rectangle(rec.position - [margin, margin], rec.size + [2*margin, 2*margin])
+
+    def damage(self):
+        """Schedules the area covered by the window to be repainted."""
+        if self._surface is not None:
+            self._surface.invalidate(self.paint_rectangle())
+
+    def damage_tree(self):
+        """Damages the window and the descendants that can be drawn outside of it."""
+        surface = self._surface
+        if surface is None:
+            return
+        if not surface.damage_tracking:
+            self.damage()
+            return
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            item.damage()
+            if item.children and not (item.clip_children or item.layer):
+                stack.extend(item.children)
+
+    def invalidate_layers(self):
+        """Marks the cached layers that contain this window as stale."""
+        window = self
+        while window is not None:
+            if window.layer:
+                window.layer_version += 1
+            window = window.parent
+
+    def invalidate(self):
+        """Schedules the window to be rendered again."""
+        self.damage()
+        self.invalidate_layers()
+
+    def invalidate_tree(self):
+        """Invalidates the window and all of its descendants."""
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            item.invalidate()
+            if item.children:
+                stack.extend(item.children)
+
+    def discard_layers(self):
+        """Frees the cached layers of the window and all of its descendants."""
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if item.layer_key is not None:
+                self.layer_cache.discard(item.layer_key)
+                item.layer_key = None
+            if item.children:
+                stack.extend(item.children)
+
     def render(self):
         super(Window, self).render()
         self.draw_rounded_rect([0,0], [self.size.width, self.size.height],
@@ -569,11 +1162,13 @@ class Window(WindowEventSource, WindowSurface):
 
     @resizable.setter
     def resizable(self, value):
-        if not self._resizable and value:
-            self.init_resize_handles()
-        elif not value and self._resizable:
-            self.remove_resize_handles()
-        self._resizable = value
+        if value != self._resizable:
+            self._resizable = value
+            #The handles reach outside of the window
+            if self._surface is not None:
+                self._surface.spatial_index.update(self)
+                if self._surface.scene_store is not None:
+                    self._surface.scene_store.update(self)
 
     @property
     def draggable(self):
@@ -622,14 +1217,15 @@ class Window(WindowEventSource, WindowSurface):
         self._restrict_pos_size_width(new_pos, new_size)
         return new_pos, new_size
 
-    def drag_bottomright_handle(self, obj, mouse_pos):
+    def drag_bottomright_handle(self, mouse_pos):
         diff = mouse_pos - self.mouse_diff
         old_size = Size.from_value(self.size)
         self.size = self.size + diff
-        self.mouse_diff.y = obj.position.y + self.handle_diff.y
-        self.mouse_diff.x = obj.position.x + self.handle_diff.x
+        handle = self.handle_rectangle('bottomright')
+        self.mouse_diff.y = handle.position.y + self.handle_diff.y
+        self.mouse_diff.x = handle.position.x + self.handle_diff.x
 
-    def drag_bottomleft_handle(self, obj, mouse_pos):
+    def drag_bottomleft_handle(self, mouse_pos):
         diff = mouse_pos - self.mouse_diff
         old_size = Size.from_value(self.size)
         new_pos = Position(self.position.x + diff.x, self.position.y)
@@ -643,10 +1239,11 @@ class Window(WindowEventSource, WindowSurface):
         else:
             self.size = [self.size.width, new_size.height]
 
-        self.mouse_diff.y = obj.position.y + self.handle_diff.y
-        self.mouse_diff.x = obj.position.x + self.handle_diff.x
+        handle = self.handle_rectangle('bottomleft')
+        self.mouse_diff.y = handle.position.y + self.handle_diff.y
+        self.mouse_diff.x = handle.position.x + self.handle_diff.x
 
-    def drag_topright_handle(self, obj, mouse_pos):
+    def drag_topright_handle(self, mouse_pos):
         diff = mouse_pos - self.mouse_diff
         old_size = Size.from_value(self.size)
         new_pos = Position(self.position.x, self.position.y + diff.y)
@@ -660,10 +1257,11 @@ class Window(WindowEventSource, WindowSurface):
         else:
             self.size = [new_size.width, self.size.height]
 
-        self.mouse_diff.y = obj.position.y + self.handle_diff.y
-        self.mouse_diff.x = obj.position.x + self.handle_diff.x
+        handle = self.handle_rectangle('topright')
+        self.mouse_diff.y = handle.position.y + self.handle_diff.y
+        self.mouse_diff.x = handle.position.x + self.handle_diff.x
 
-    def drag_topleft_handle(self, obj, mouse_pos):
+    def drag_topleft_handle(self, mouse_pos):
         diff = mouse_pos - self.mouse_diff
         old_size = Size.from_value(self.size)
         new_pos = Position(self.position.x + diff.x, self.position.y + diff.y)
@@ -675,10 +1273,11 @@ class Window(WindowEventSource, WindowSurface):
             self.position = new_pos
             self.size = new_size
 
-        self.mouse_diff.y = obj.position.y + self.handle_diff.y
-        self.mouse_diff.x = obj.position.x + self.handle_diff.x
+        handle = self.handle_rectangle('topleft')
+        self.mouse_diff.y = handle.position.y + self.handle_diff.y
+        self.mouse_diff.x = handle.position.x + self.handle_diff.x
 
-    def drag_top_handle(self, obj, mouse_pos):
+    def drag_top_handle(self, mouse_pos):
         diff = mouse_pos - self.mouse_diff
         old_size = Size.from_value(self.size)
         new_pos = Position(self.position.x, self.position.y + diff.y)
@@ -690,10 +1289,11 @@ class Window(WindowEventSource, WindowSurface):
             self.position = new_pos
             self.size = new_size
 
-        self.mouse_diff.y = obj.position.y + self.handle_diff.y
-        self.mouse_diff.x = obj.position.x + self.handle_diff.x
+        handle = self.handle_rectangle('top')
+        self.mouse_diff.y = handle.position.y + self.handle_diff.y
+        self.mouse_diff.x = handle.position.x + self.handle_diff.x
 
-    def drag_left_handle(self, obj, mouse_pos):
+    def drag_left_handle(self, mouse_pos):
         diff = mouse_pos - self.mouse_diff
         old_size = Size.from_value(self.size)
         new_pos = Position(self.position.x+diff.x, self.position.y)
@@ -705,149 +1305,65 @@ class Window(WindowEventSource, WindowSurface):
             self.position = new_pos
             self.size = new_size
 
-        self.mouse_diff.x = obj.position.x + self.handle_diff.x
+        handle = self.handle_rectangle('left')
+        self.mouse_diff.x = handle.position.x + self.handle_diff.x
 
-    def drag_bottom_handle(self, obj, mouse_pos):
+    def drag_bottom_handle(self, mouse_pos):
         diff = mouse_pos - self.mouse_diff
         old_height = self.size.height
         self.size = Size(self.size.width, self.size.height+diff.y)
 
-        self.mouse_diff.y = obj.position.y + self.handle_diff.y
+        handle = self.handle_rectangle('bottom')
+        self.mouse_diff.y = handle.position.y + self.handle_diff.y
 
-    def drag_right_handle(self, obj, mouse_pos):
+    def drag_right_handle(self, mouse_pos):
         diff = mouse_pos - self.mouse_diff
         old_width = self.size.width
         self.size = Size(self.size.width + diff.x, self.size.height)
 
-        self.mouse_diff.x = obj.position.x + self.handle_diff.x
-
-    def remove_resize_handles(self):
-        self.remove_child(self.top_handle)
-        self.remove_child(self.topleft_handle)
-        self.remove_child(self.topright_handle)
-        self.remove_child(self.left_handle)
-        self.remove_child(self.right_handle)
-        self.remove_child(self.bottom_handle)
-        self.remove_child(self.bottomright_handle)
-        self.remove_child(self.bottomleft_handle)
-        self.top_handle = None
-        self.topleft_handle = None
-        self.topright_handle = None
-        self.left_handle = None
-        self.right_handle = None
-        self.bottom_handle = None
-        self.bottomright_handle = None
-        self.bottomleft_handle = None
-
-    def init_resize_handles(self):
-        self.handle_diff = Position(0,0)
-
-        self.top_handle = Window('top_handle')
-        self.top_handle.accept('drag', self.drag_top_handle)
-        self.top_handle.accept('mouse-left', self.handle_click)
-        self.top_handle.accept('mouse-left-up', self.handle_click_up)
-
-        self.topleft_handle = Window('topleft_handle')
-        self.topleft_handle.accept('drag', self.drag_topleft_handle)
-        self.topleft_handle.accept('mouse-left', self.handle_click)
-        self.topleft_handle.accept('mouse-left-up', self.handle_click_up)
-
-        self.topright_handle = Window('topright_handle')
-        self.topright_handle.accept('drag', self.drag_topright_handle)
-        self.topright_handle.accept('mouse-left', self.handle_click)
-        self.topright_handle.accept('mouse-left-up', self.handle_click_up)
-
-        self.right_handle = Window('right_handle')
-        self.right_handle.accept('drag', self.drag_right_handle)
-        self.right_handle.accept('mouse-left', self.handle_click)
-        self.right_handle.accept('mouse-left-up', self.handle_click_up)
-
-        self.bottomright_handle = Window('bottomright_handle')
-        self.bottomright_handle.accept('drag', self.drag_bottomright_handle)
-        self.bottomright_handle.accept('mouse-left', self.handle_click)
-        self.bottomright_handle.accept('mouse-left-up', self.handle_click_up)
-
-        self.bottom_handle = Window('bottom_handle')
-        self.bottom_handle.accept('drag', self.drag_bottom_handle)
-        self.bottom_handle.accept('mouse-left', self.handle_click)
-        self.bottom_handle.accept('mouse-left-up', self.handle_click_up)
-
-        self.bottomleft_handle = Window('bottomleft_handle')
-        self.bottomleft_handle.accept('drag', self.drag_bottomleft_handle)
-        self.bottomleft_handle.accept('mouse-left', self.handle_click)
-        self.bottomleft_handle.accept('mouse-left-up', self.handle_click_up)
-
-        self.left_handle = Window('left_handle')
-        self.left_handle.accept('drag', self.drag_left_handle)
-        self.left_handle.accept('mouse-left', self.handle_click)
-        self.left_handle.accept('mouse-left-up', self.handle_click_up)
-
-
-        self.vertical_edge_size = Size()
-        self.horizontal_edge_size = Size()
-
-        self.add_child(self.top_handle)
-        self.add_child(self.topleft_handle)
-        self.add_child(self.topright_handle)
-        self.add_child(self.left_handle)
-        self.add_child(self.right_handle)
-        self.add_child(self.bottom_handle)
-        self.add_child(self.bottomright_handle)
-        self.add_child(self.bottomleft_handle)
-        self.update_resize_handles()
-
-    def update_resize_handles(self):
+        handle = self.handle_rectangle('right')
+        self.mouse_diff.x = handle.position.x + self.handle_diff.x
+
+    def handle_rectangles(self):
+        """
+        Returns the areas of the surface that grab the resize handles, from
+        the bottom to the top. The handles reach edge_handle_buffer past
+        the edges of the window.
+        """
+        x, y = self.absolute_position
+        width, height = self.size
+        corner = self.corner_handle_size
         buffer = self.edge_handle_buffer
-        top = self.top_handle
-        topleft = self.topleft_handle
-        topright = self.topright_handle
-        right = self.right_handle
-        bottomright = self.bottomright_handle
-        bottom = self.bottom_handle
-        bottomleft = self.bottomleft_handle
-        left = self.left_handle
-        vertical_edge_size = self.vertical_edge_size
-        horizontal_edge_size = self.horizontal_edge_size
-        corner_handle_size = self.corner_handle_size
-        x, y = self.position.x, self.position.y
-
-        vertical_edge_size.width = self.size.width - 2*corner_handle_size.width
-        vertical_edge_size.height = self.edge_handle_width
-
-        horizontal_edge_size.width = self.edge_handle_width
-        horizontal_edge_size.height = self.size.height - 2*corner_handle_size.height
-
-        top.position.x = x + corner_handle_size.width
-        top.position.y = y - buffer.height
-        top.size = vertical_edge_size + [0, buffer.height]
-
-        topleft.position.x = x - buffer.width
-        topleft.position.y = y - buffer.height
-        topleft.size = corner_handle_size + buffer
-
-        topright.position.x = x + self.size.width - corner_handle_size.width
-        topright.position.y = y - buffer.height
-        topright.size = corner_handle_size + buffer
-
-        bottom.position.x = x + corner_handle_size.width
-        bottom.position.y = y + self.size.height - vertical_edge_size.height
-        bottom.size = vertical_edge_size + [0, buffer.height]
-
-        bottomleft.position.x = x - buffer.width
-        bottomleft.position.y = y + self.size.height - corner_handle_size.height
-        bottomleft.size = corner_handle_size + buffer
-
-        bottomright.position.x = x + self.size.width-corner_handle_size.width
-        bottomright.position.y = y + self.size.height-corner_handle_size.height
-        bottomright.size = corner_handle_size + buffer
-
-        right.position.x = x + self.size.width-horizontal_edge_size.width
-        right.position.y = y + corner_handle_size.height
-        right.size = horizontal_edge_size + [buffer.width, 0]
-
-        left.position.x = x - buffer.width
-        left.position.y = y + corner_handle_size.height
-        left.size = horizontal_edge_size + [buffer.width, 0]
+        edge = self.edge_handle_width
+        corner_size = corner + buffer
+        return [('top', Rectangle((x + corner.width, y - buffer.height),
+                                  (width - 2*corner.width, edge + buffer.height))),
+                ('topleft', Rectangle((x - buffer.width, y - buffer.height), corner_size)),
+                ('topright', Rectangle((x + width - corner.width, y - buffer.height), corner_size)),
+                ('left', Rectangle((x - buffer.width, y + corner.height),
+                                   (edge + buffer.width, height - 2*corner.height))),
+                ('right', Rectangle((x + width - edge, y + corner.height),
+                                    (edge + buffer.width, height - 2*corner.height))),
+                ('bottom', Rectangle((x + corner.width, y + height - edge),
+                                     (width - 2*corner.width, edge + buffer.height))),
+                ('bottomright', Rectangle((x + width - corner.width, y + height - corner.height), corner_size)),
+                ('bottomleft', Rectangle((x - buffer.width, y + height - corner.height), corner_size))]
+
+    def handle_rectangle(self, name):
+        for handle, rectangle in self.handle_rectangles():
+            if handle == name:
+                return rectangle
+
+    def handle_at(self, position):
+        """Returns the name of the resize handle at the position, or None."""
+        if self._resizable:
+            for handle, rectangle in reversed(self.handle_rectangles()):
+                if rectangle.intersects_with(position):
+                    return handle
+        return None
+
+    def drag_handle(self, mouse_pos):
+        getattr(self, 'drag_{}_handle'.format(self.active_handle))(mouse_pos)
 
     def drag(self, obj, mouse_pos):
         obj.position = mouse_pos - self.mouse_diff
@@ -856,16 +1372,19 @@ class Window(WindowEventSource, WindowSurface):
         self.mouse_diff = mouse_pos - obj.position
 
     def click_up(self, obj, mouse_pos):
-        self.mouse_diff = Position(0, 0)
+        self.mouse_diff = self._no_offset
 
-    def handle_click_up(self, obj, mouse_pos):
-        self.mouse_diff = Position(0, 0)
-        self.handle_diff = Position(0, 0)
+    def handle_click_up(self, handle, mouse_pos):
+        self.active_handle = None
+        self.mouse_diff = self._no_offset
+        self.handle_diff = self._no_offset
         self.dispatch('resize-end', self)
 
-    def handle_click(self, obj, mouse_pos):
-        self.mouse_diff = mouse_pos
-        self.handle_diff = mouse_pos - obj.position
+    def handle_click(self, handle, mouse_pos):
+        self.active_handle = handle
+        #Changed in place while the handle is dragged
+        self.mouse_diff = Position(mouse_pos.x, mouse_pos.y)
+        self.handle_diff = mouse_pos - self.handle_rectangle(handle).position
         self.dispatch('resize-start', self)
 
     def show(self):
@@ -884,42 +1403,70 @@ class Window(WindowEventSource, WindowSurface):
         if l:
             return l[-1]
 
+    def path_from_root(self):
+        """Returns the windows from the root of the tree down to this one."""
+        path = []
+        window = self
+        while window is not None:
+            path.append(window)
+            window = window.parent
+        path.reverse()
+        return path
+
+    def hovered_path(self):
+        """Returns the path to the hovered window if it's in this window's tree, or None."""
+        target = self.surface.current_hover_window
+        if target is not None:
+            path = target.path_from_root()
+            if self in path:
+                return path
+
     def inject_mouse_down(self, button):
-        stack = [self]
-        while stack:
-            item = stack.pop()
-            if item.mouse_inside():
-                log(button, item.name)
-                item.mouse_inputs[button] = True
-                item.mouse_down = True
-                item.grab_focus()
-                item.dispatch(button, item, item.mouse_pos)
+        """
+        Presses the button on the hovered window, which takes the focus from
+        the other windows in this tree. The event is propagated along the
+        ancestors of the hovered window.
+        """
+        path = self.hovered_path()
+        target = path[-1] if path else None
+        for window in list(self.surface.focused_windows):
+            if window is not target and self in window.path_from_root():
+                window.release_focus()
+        if target is not None:
+            log(button, target.name)
+            if target.mouse_inputs is target._no_mouse_inputs:
+                target.mouse_inputs = dict(target._no_mouse_inputs)
+            target.mouse_inputs[button] = True
+            target.mouse_down = True
+            target.grab_focus()
+            handle = target.surface.current_hover_handle
+            if handle is not None and button == 'mouse-left':
+                target.handle_click(handle, target.mouse_pos)
             else:
-                item.release_focus()
-            if item.children:
-                stack.extend(item.children)
+                propagate(path, button, target, target.mouse_pos)
 
     def inject_mouse_double(self, button):
-        stack = [self]
-        while stack:
-            item = stack.pop()
-            if item.mouse_inside():
-                log(button+'-double', item.name)
-                item.dispatch(button+'-double', item, item.mouse_pos)
-            if item.children:
-                stack.extend(item.children)
+        path = self.hovered_path()
+        if path:
+            target = path[-1]
+            log(button+'-double', target.name)
+            propagate(path, button+'-double', target, target.mouse_pos)
 
     def inject_mouse_up(self, button):
-        stack = [self]
-        while stack:
-            item = stack.pop()
+        """Releases the button on the windows of this tree it was pressed on."""
+        #Windows only hold the mouse while they have the focus
+        for item in list(self.surface.focused_windows):
             if item.mouse_held() and item.mouse_inputs[button]:
+                path = item.path_from_root()
+                if self not in path:
+                    continue
                 log(button+'-up', item.name)
                 item.mouse_down = False
                 item.mouse_inputs[button] = False
-                item.dispatch('{}-up'.format(button), item, item.mouse_pos)
-            if item.children:
-                stack.extend(item.children)
+                if item.active_handle is not None and button == 'mouse-left':
+                    item.handle_click_up(item.active_handle, item.mouse_pos)
+                else:
+                    propagate(path, '{}-up'.format(button), item, item.mouse_pos)
 
 
     def inject_mouse_position(self, pos):
@@ -927,40 +1474,40 @@ class Window(WindowEventSource, WindowSurface):
         stack = [self]
         while stack:
             item = stack.pop()
-            diff = mouse_pos - item.mouse_pos
-            old_pos = item.mouse_pos
-            item.mouse_pos = mouse_pos
-            if diff != Position(0,0):
-                item.dispatch('mouse-move', item, old_pos, self.mouse_pos)
-                if item.focused and item.mouse_down:
-                    for button, down in item.mouse_inputs.items():
-                        if down:
-                            item.dispatch('{}-drag'.format(button), item, self.mouse_pos)
-                            item.dispatch('drag', item, self.mouse_pos)
+            item.move_mouse(mouse_pos)
             if item.children:
                 stack.extend(item.children)
 
+    def move_mouse(self, mouse_pos):
+        """Updates the mouse position of this window only, dragging it if it's held."""
+        old_pos = self.mouse_pos
+        self.mouse_pos = mouse_pos
+        if mouse_pos.x != old_pos.x or mouse_pos.y != old_pos.y:
+            self.dispatch('mouse-move', self, old_pos, mouse_pos)
+            if self.active_handle is not None:
+                self.drag_handle(mouse_pos)
+            elif self.focused and self.mouse_down:
+                for button, down in self.mouse_inputs.items():
+                    if down:
+                        self.dispatch('{}-drag'.format(button), self, mouse_pos)
+                        self.dispatch('drag', self, mouse_pos)
+
     def inject_mouse_wheel(self, value):
-        stack = [self]
-        while stack:
-            item = stack.pop()
-            if item.mouse_inside():
-                log(item.name, 'scroll', value)
-                item.dispatch('scroll', item, value)
-            if item.children:
-                stack.extend(item.children)
+        path = self.hovered_path()
+        if path:
+            target = path[-1]
+            log(target.name, 'scroll', value)
+            propagate(path, 'scroll', target, value)
 
     def grab_focus(self):
         self.focused = True
+        if self._surface is not None:
+            self._surface.focused_windows.add(self)
         parent = self
         #Reorder all the windows so that they are drawn on top
         while parent is not None:
-            if parent.parent is not None:
-                children = parent.parent.children[:]
-                children.remove(parent)
-                children.append(parent)
-
-                parent.parent.children = children
+            if parent.parent is not None and not parent.parent.children.is_top(parent):
+                parent.parent.children.raise_to_top(parent)
 
             parent = parent.parent
 
@@ -970,12 +1517,15 @@ class Window(WindowEventSource, WindowSurface):
         if self.focused:
             log('focus-lost', self.name)
             self.focused = False
+            if self._surface is not None:
+                self._surface.focused_windows.discard(self)
             self.mouse_down = False
             #clear events that may have been triggered
             #eg. User clicks on one window, holds, and
             #then releases on another
-            for key in self.mouse_inputs:
-                self.mouse_inputs[key] = False
+            self.mouse_inputs = self._no_mouse_inputs
+            if self.active_handle is not None:
+                self.handle_click_up(self.active_handle, self.mouse_pos)
             self.dispatch('focus-lost', self)
 
     @property
@@ -993,12 +1543,21 @@ class Window(WindowEventSource, WindowSurface):
         return self._root
 
     def mouse_inside(self):
-        return self is self.surface.current_hover_window
+        """Checks if the mouse is over this window or one of its descendants."""
+        window = self.surface.current_hover_window
+        while window is not None:
+            if window is self:
+                return True
+            window = window.parent
+        return False
 
     def mouse_held(self):
         return self.mouse_down
 
     def process_mouse_move(self, obj, old_mpos, new_mpos):
+        #Routed moves are entered and left by the surface
+        if self.surface.route_mouse_moves:
+            return
         mouse_focus = self.mouse_inside()
         if not self.mouse_held():
             if mouse_focus:
@@ -1026,7 +1585,9 @@ class Window(WindowEventSource, WindowSurface):
     def add_child(self, child_window):
         if child_window not in self.children:
             child_window.parent = self
-            child_window.position = child_window.position + self.position +\
+            child_window.invalidate_positions()
+            #Children are placed inside of the border and padding
+            child_window.position = child_window.position +\
                                     [self.border_width/2, self.border_width/2] +\
                                     [self.padding.left, self.padding.top]
             child_window.surface = self.surface
@@ -1035,23 +1596,88 @@ class Window(WindowEventSource, WindowSurface):
     def remove_child(self, child_window):
         try:
             self.children.remove(child_window)
+            child_window.discard_layers()
+            if self._surface is not None:
+                #The surface mustn't keep the removed windows alive. They
+                #stop tracking the mouse and are left without it.
+                surface = self._surface
+                for windows in (surface.focused_windows, surface.mouse_trackers):
+                    for window in list(windows):
+                        if child_window in window.path_from_root():
+                            windows.discard(window)
+                            window.mouse_in = False
+                hovered = surface.current_hover_window
+                path = hovered.path_from_root() if hovered is not None else []
+                if child_window in path:
+                    for window in path[path.index(child_window):]:
+                        window.mouse_in = False
+                    surface.current_hover_window = surface.root_window
+                    surface.current_hover_handle = None
+                path = surface.hover_path
+                if child_window in path:
+                    for window in path[path.index(child_window):]:
+                        window.mouse_in = False
+                    del path[path.index(child_window):]
+                if child_window in surface.current_focused_window.path_from_root():
+                    surface.current_focused_window = surface.root_window
             child_window.parent = None
+            child_window.invalidate_positions()
         except ValueError:
             pass
 
     @property
     def position(self):
+        """The position of the window relative to its parent."""
         return self.rectangle.position
 
     @position.setter
     def position(self, position):
         position = Position.from_value(position)
-        diff = position - self.rectangle.position
-        if diff.x != 0 or diff.y != 0:
+        old_position = self.rectangle.position
+        if position.x != old_position.x or position.y != old_position.y:
+            self.damage_tree()
+            self.rectangle.position = position
+            self.invalidate_positions()
+            self.damage_tree()
             self.dispatch('move', self, position)
-            for child in self.children:
-                child.position = child.position + diff
-        self.rectangle.position = position
+            #Moving doesn't change how the window looks, only the layers
+            #it's drawn into
+            if self.parent is not None:
+                self.parent.invalidate_layers()
+            if self._surface is not None:
+                self._surface.spatial_index.update_tree(self)
+        else:
+            self.rectangle.position = position
+
+    @property
+    def absolute_position(self):
+        """The position of the window on the surface, cached until it or an ancestor moves."""
+        position = self._absolute_position
+        if position is None:
+            position = self.rectangle.position
+            if self.parent is not None:
+                position = self.parent.absolute_position + position
+            self._absolute_position = position
+        return position
+
+    def invalidate_positions(self):
+        """Forgets the cached absolute positions of the window and its descendants."""
+        #A window's position is only cached along with its parent's, so
+        #below a window without one there's nothing left to forget
+        stack = [self]
+        while stack:
+            window = stack.pop()
+            if window._absolute_position is not None:
+                window._absolute_position = None
+                if window.children:
+                    stack.extend(window.children)
+
+    def absolute_rectangle(self):
+        return Rectangle(self.absolute_position, self.rectangle.size)
+
+    def move_by(self, diff):
+        """Moves the window, and its children with it, by the given offset."""
+        self.position = self.rectangle.position + diff
 
     @property
     def size(self):
@@ -1060,29 +1686,40 @@ class Window(WindowEventSource, WindowSurface):
     @size.setter
     def size(self, size):
         size = Size.from_value(size)
+        width, height = size.width, size.height
 
-        if size.height <= self.min_size.height:
-            size.height = self.min_size.height
-        if size.width <= self.min_size.width:
-            size.width = self.min_size.width
+        if height <= self.min_size.height:
+            height = self.min_size.height
+        if width <= self.min_size.width:
+            width = self.min_size.width
 
-        if self.max_size.width > -1 and size.width >= self.max_size.width:
-            size.width = self.max_size.width
-        if self.max_size.height > -1 and size.height >= self.max_size.height:
-            size.height = self.max_size.height
+        if self.max_size.width > -1 and width >= self.max_size.width:
+            width = self.max_size.width
+        if self.max_size.height > -1 and height >= self.max_size.height:
+            height = self.max_size.height
+        #The given size may be shared, eg. another window's
+        if width != size.width or height != size.height:
+            size = Size(width, height)
 
         diff = size - self.rectangle.size
         if diff.height != 0 or diff.width != 0:
+            self.invalidate()
             self.dispatch('resize', self, size)
             for child in self.children:
                 pass
             #    child.size = child.size + diff
         self.rectangle.size = size
+        self.invalidate()
+        if self._surface is not None:
+            if self.clip_children:
+                self._surface.spatial_index.update_tree(self)
+            else:
+                self._surface.spatial_index.update(self)
 
-        if self.resizable:
-            self.update_resize_handles()
 
 class Mouse(Window):
+    visual_attributes = Window.visual_attributes | frozenset(['lines'])
+
     def __init__(self, *args,  **kwargs):
         super(Mouse, self).__init__(*args, **kwargs)
         self.lines = [
@@ -1099,15 +1736,19 @@ class Mouse(Window):
 
 
 class TextWindow(Window):
+    visual_attributes = Window.visual_attributes | frozenset(['text', 'font_size', 'font_style',
+                                                              'font_weight', 'font_family',
+                                                              'word_wrap', 'font_color'])
+
+    font_size = StyleOption('font_size')
+    font_style = StyleOption('font_style')
+    font_weight = StyleOption('font_weight')
+    font_family = StyleOption('font_family')
+    word_wrap = StyleOption('word_wrap')
+    font_color = StyleOption('font_color')
 
     def __init__(self, name, text, *args, **kwargs):
         super(TextWindow, self).__init__(name, *args, **kwargs)
-        self.font_size = kwargs.pop('font_size', 12)
-        self.font_style = kwargs.pop('font_style', 'normal')
-        self.font_weight = kwargs.pop('font_weight', 'normal')
-        self.font_family = kwargs.pop('font_family', 'Sans')
-        self.word_wrap = kwargs.pop('word_wrap', 'word')
-        self.font_color = Color.from_value(kwargs.pop('font_color', (0,0,0,1)))
         self.text = text
 
     def render(self):
@@ -1118,6 +1759,8 @@ class TextWindow(Window):
                        font_color=self.font_color, word_wrap=self.word_wrap)
 
 class ImageWindow(Window):
+    visual_attributes = Window.visual_attributes | frozenset(['image'])
+
     def __init__(self, name, image_path, *args, **kwargs):
         super(ImageWindow, self).__init__(name, *args, **kwargs)
         self.image_path = image_path
@@ -0,0 +1,85 @@
+import cairo
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from .structures import Rectangle
+
+
+class TiledRenderer(object):
+    """
+    Rasterizes a surface as a grid of tiles on a pool of threads.
+
+    The windows are walked once and recorded into a new
+    cairo.RecordingSurface every frame, so nothing from the last frame
+    can show through. Every tile that needs painting then replays the
+    recording into its own image surface. Cairo releases the GIL while it
+    rasterizes, so the tiles are painted on several cores at once before
+    being stitched back into the surface's context.
+
+    tile_size: width and height of a tile in pixels
+    threads: number of rasterizing threads, defaults to the number of cores
+    """
+    def __init__(self, tile_size=256, threads=None):
+        self.tile_size = tile_size
+        self.threads = threads or multiprocessing.cpu_count()
+        self.pool = None
+        self.tiles = {}
+        self.size = None
+
+    def get_tiles(self, size, region=None):
+        """Returns the (x, y, width, height) of every tile overlapping the region."""
+        tiles = []
+        tile_size = self.tile_size
+        for y in range(0, int(size.height), tile_size):
+            for x in range(0, int(size.width), tile_size):
+                tile = (x, y, min(tile_size, int(size.width) - x), min(tile_size, int(size.height) - y))
+                if region is None or Rectangle(tile[:2], tile[2:]).overlaps_any(region):
+                    tiles.append(tile)
+        return tiles
+
+    def rasterize(self, recording, tile):
+        x, y, width, height = tile
+        image = self.tiles.get(tile)
+        if image is None:
+            image = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            self.tiles[tile] = image
+        context = cairo.Context(image)
+        context.set_operator(cairo.OPERATOR_SOURCE)
+        context.set_source_surface(recording, -x, -y)
+        context.paint()
+        image.flush()
+        return image
+
+    def render(self, surface, region=None):
+        """Draws the windows of the surface into its context, tile by tile."""
+        if self.pool is None:
+            self.pool = ThreadPool(self.threads)
+        if self.size != surface.size:
+            self.tiles = {}
+            self.size = surface.size
+
+        recording = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, None)
+        context = surface.context
+        surface.context = cairo.Context(recording)
+        try:
+            for window in surface.windows:
+                window.draw()
+        finally:
+            surface.context = context
+
+        tiles = self.get_tiles(surface.size, region)
+        images = self.pool.map(lambda tile: self.rasterize(recording, tile), tiles)
+
+        context.save()
+        context.set_operator(cairo.OPERATOR_SOURCE)
+        for (x, y, width, height), image in zip(tiles, images):
+            context.set_source_surface(image, x, y)
+            context.rectangle(x, y, width, height)
+            context.fill()
+        context.restore()
+
+    def close(self):
+        """Stops the threads, called by Surface.close."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,129 @@
+from ..events.events import EventSource
+
+
+class ZOrderList(EventSource):
+    """
+    The children of a window, in the order they are drawn. Every item has
+    a z index, so raising or lowering an item only changes its index
+    instead of moving it around in a list. The drawing order is sorted
+    again on the first iteration after a change.
+
+    Adding, raising and lowering are O(1). When the item at the top or
+    the bottom is removed, or moved away from its end, finding the new
+    end is O(n), like the sort that the next iteration does anyway.
+
+    Dispatches 'add', 'remove' and 'reorder' with the list and the item
+    that changed. When the list has an owner window on a surface, the
+    surface dispatches them too as 'children-add', 'children-remove' and
+    'children-reorder', so its parts only need to listen in one place.
+    """
+    types = ['add', 'remove', 'reorder']
+
+    __slots__ = ('owner', '_z', '_top', '_bottom', '_sorted')
+
+    #Most windows have no children, their lists share these until the
+    #first item is added
+    _no_items = {}
+    _no_order = ()
+
+    def __init__(self, items=(), owner=None):
+        super(ZOrderList, self).__init__()
+        self.owner = owner
+        self._z = self._no_items
+        self._top = 0
+        self._bottom = 0
+        self._sorted = self._no_order
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return len(self._z)
+
+    def __contains__(self, item):
+        return item in self._z
+
+    def __iter__(self):
+        return iter(self.items())
+
+    def __getitem__(self, index):
+        return self.items()[index]
+
+    def __repr__(self):
+        return u'ZOrderList {}'.format(self.items())
+
+    def items(self):
+        """Returns the items from the bottom to the top."""
+        if self._sorted is None:
+            self._sorted = sorted(self._z, key=self._z.__getitem__)
+        return self._sorted
+
+    def index(self, item):
+        return self.items().index(item)
+
+    def z_index(self, item):
+        """Returns a number that is larger the higher up the item is drawn."""
+        return self._z[item]
+
+    def is_top(self, item):
+        return self._z.get(item) == self._top
+
+    def append(self, item):
+        """Adds the item on top. Items already in the list are raised."""
+        if item in self._z:
+            self.raise_to_top(item)
+            return
+        if self._z is self._no_items:
+            self._z = {}
+            self._sorted = []
+        self._top += 1
+        self._z[item] = self._top
+        if len(self._z) == 1:
+            self._bottom = self._top
+        if self._sorted is not None:
+            self._sorted.append(item)
+        self._changed('add', item)
+
+    def remove(self, item):
+        if item not in self._z:
+            raise ValueError('ZOrderList.remove(x): x not in list')
+        z = self._z.pop(item)
+        if z == self._top or z == self._bottom:
+            self._find_ends()
+        self._sorted = None
+        self._changed('remove', item)
+
+    def raise_to_top(self, item):
+        z = self._z[item]
+        if z != self._top:
+            self._top += 1
+            self._z[item] = self._top
+            if z == self._bottom:
+                self._find_ends()
+            self._sorted = None
+            self._changed('reorder', item)
+
+    def lower_to_bottom(self, item):
+        z = self._z[item]
+        if z != self._bottom:
+            self._bottom -= 1
+            self._z[item] = self._bottom
+            if z == self._top:
+                self._find_ends()
+            self._sorted = None
+            self._changed('reorder', item)
+
+    def _changed(self, event, item):
+        self.dispatch(event, self, item)
+        surface = self.owner.surface if self.owner is not None else None
+        if surface is not None:
+            surface.dispatch('children-' + event, self, item)
+
+    def _find_ends(self):
+        #The top and bottom have to be indices of items in the list, for
+        #is_top and for raising and lowering to know when there's nothing
+        #to do. Only needed when the item at either end moves or goes.
+        if self._z:
+            self._top = max(self._z.values())
+            self._bottom = min(self._z.values())
+        else:
+            self._top = self._bottom = 0
@@ -90,9 +90,15 @@ class Test(ShowBase):
 
     def drawall(self, task):
         if self._render:
-            self.surf.draw()
-            ri = self.cairoTexture.modifyRamImage()
-            ri.setData(self.surf.csurface.get_data())
+            #Only upload the texture when the surface actually changed
+            if self.surf.draw():
+                stats = self.surf.frame_stats
+                if stats is not None:
+                    stats.start('upload')
+                ri = self.cairoTexture.modifyRamImage()
+                ri.setData(self.surf.csurface.get_data())
+                if stats is not None:
+                    stats.stop()
             return task.cont
 
     def mousemove(self, task):
@@ -11,9 +11,9 @@ class JGUIWidget(QtGui.QWidget):
         self.width = width
         self.height = height
         self.setWindowTitle("JGUI Qt")
-        redrawTimer = QtCore.QTimer(self)
-        self.connect(redrawTimer,  QtCore.SIGNAL("timeout()"), self, QtCore.SLOT("update()"))
-        redrawTimer.start(1000/60)
+        #Only schedule frames when something changed, at most 60 times a second
+        self.redraw_pending = False
+        self.surf.accept('redraw-needed', self.request_redraw)
         self.setCursor(QtGui.QCursor(QtCore.Qt.BlankCursor))
         self.button = QtGui.QPushButton('Test', self)
         self.button.setCursor(QtGui.QCursor(QtCore.Qt.ArrowCursor))
@@ -23,6 +23,15 @@ class JGUIWidget(QtGui.QWidget):
 
         self.paintSurface = QtGui.QPainter(self)
 
+    def request_redraw(self, surface):
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            QtCore.QTimer.singleShot(1000/60, self.redraw)
+
+    def redraw(self):
+        self.redraw_pending = False
+        self.update()
+
     def mousePressEvent(self, event):
         if event.button() == QtCore.Qt.LeftButton:
             self.surf.inject_mouse_down('mouse-left')
@@ -11,14 +11,23 @@ class JGUIWidget(QtGui.QWidget):
         self.width = width
         self.height = height
         self.setWindowTitle("JGUI Qt")
-        redrawTimer = QtCore.QTimer(self)
-        self.connect(redrawTimer,  QtCore.SIGNAL("timeout()"), self, QtCore.SLOT("update()"))
-        redrawTimer.start(1000/60)
+        #Only schedule frames when something changed, at most 60 times a second
+        self.redraw_pending = False
+        self.surf.accept('redraw-needed', self.request_redraw)
 
         self.paintSurface = QtGui.QLabel(self)
         self.paintSurface.setGeometry(0, 0, width, height)
         self.paintSurface.show()
 
+    def request_redraw(self, surface):
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            QtCore.QTimer.singleShot(1000/60, self.redraw)
+
+    def redraw(self):
+        self.redraw_pending = False
+        self.update()
+
     def mousePressEvent(self, event):
         if event.button() == QtCore.Qt.LeftButton:
             self.surf.inject_mouse_down('mouse-left')
@@ -49,10 +58,16 @@ class JGUIWidget(QtGui.QWidget):
         return QtGui.QMainWindow.eventFilter(self, source, event)
 
     def paintEvent(self,  event):
-        self.surf.draw()
-        img = QtGui.QImage(self.surf.csurface.get_data(), self.width, self.height, QtGui.QImage.Format_ARGB32)
-        self.paintPixmap = QtGui.QPixmap.fromImage(img)
-        self.paintSurface.setPixmap(self.paintPixmap)
+        #The label keeps showing the last pixmap when nothing changed
+        if self.surf.draw():
+            stats = self.surf.frame_stats
+            if stats is not None:
+                stats.start('upload')
+            img = QtGui.QImage(self.surf.csurface.get_data(), self.width, self.height, QtGui.QImage.Format_ARGB32)
+            self.paintPixmap = QtGui.QPixmap.fromImage(img)
+            self.paintSurface.setPixmap(self.paintPixmap)
+            if stats is not None:
+                stats.stop()
 
 if __name__ == "__main__":
     app = QtGui.QApplication(sys.argv)
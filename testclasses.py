@@ -6,6 +6,8 @@ class TestSurface(Surface):
     def __init__(self, *args, **kwargs):
         super(TestSurface, self).__init__(*args, **kwargs)
         self.show_fps = True
+        #Positions are relative to the parent window, absolute_position
+        #gives the place on the surface
         my_win = Window('child',
                         position=[0,0],
                         size=[500,200],
@@ -89,8 +91,10 @@ class TestWindow(Window):
         context = self.context
         radius = corner_radius
         degrees = math.pi / 180.0
-        x = position.x + self.position.x
-        y = position.y + self.position.y
+        #The context is already translated to the window, so position is
+        #relative to it
+        x = position.x
+        y = position.y
         width = size.width
         height = size.height
 